@@ -1,9 +1,30 @@
 from langchain_core.vectorstores import VectorStoreRetriever
 
 class DebugPineconeRetriever(VectorStoreRetriever):
+    # chunk_id -> metadata (chunk_store.build_metadata_index). 청크 저장소의 metadata를 기준으로 씁니다.
+    metadata_index: dict = {}
+
+    def with_metadata(self, docs):
+        """
+        벡터 검색 결과의 metadata를 청크 저장소 기준으로 맞춥니다. (BM25 결과와 같은 metadata)
+        chunk_id가 없는 벡터(청크 저장소 이전 크롤러가 랜덤 ID로 올린 것)와 청크 저장소에 없는
+        청크는 버립니다. (EnsembleRetriever가 chunk_id로 결과를 합치므로)
+        """
+        results = []
+        for doc in docs:
+            chunk_id = doc.metadata.get("chunk_id")
+            if chunk_id is None:
+                continue
+            if chunk_id in self.metadata_index:
+                doc = doc.model_copy(update={"metadata": self.metadata_index[chunk_id]})
+            elif self.metadata_index:
+                continue
+            results.append(doc)
+        return results
+
     def _get_relevant_documents(self, query: str, *, run_manager=None):
         # 1. 부모 클래스의 원래 검색 기능 실행 (Pinecone 검색)
-        results = super()._get_relevant_documents(query, run_manager=run_manager)
+        results = self.with_metadata(super()._get_relevant_documents(query, run_manager=run_manager))
         
         # 2. 결과 로그 출력
         print(f"\n🌲 [Pinecone Debug] 검색어: '{query}'")
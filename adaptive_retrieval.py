@@ -0,0 +1,159 @@
+import time
+import threading
+import numpy as np
+from langchain_core.retrievers import BaseRetriever
+
+DEFAULT_K = 5
+WIDE_K = 15                # 애매한 질문에서 각 검색 구간이 가져오는 후보 수
+KEYWORD_MARGIN = 0.3       # BM25 1등과 2등 점수 차이 비율이 이 이상이면 키워드 검색만으로 충분
+KEYWORD_MAX_TOKENS = 8     # 긴 질문은 이름이 들어 있어도 벡터 검색을 함께 사용
+WIDE_MARGIN = 0.2
+WIDE_MIN_SCORE = 3.0       # BM25 1등 점수가 이보다 낮으면 키워드가 거의 안 맞은 질문
+MIN_ENTITY_LENGTH = 2
+
+KEYWORD = "keyword"        # BM25만 사용 (벡터 검색/임베딩 생략)
+DEFAULT = "default"        # 기존 Hybrid (k=5 + RRF)
+WIDE = "wide"              # 후보를 넓혀 Hybrid 후 rerank
+
+
+def entity_names(metadata):
+    """청크 메타데이터에서 질문과 맞춰볼 이름(가이드 제목, 스킬명)을 꺼냅니다."""
+    names = {metadata.get("title"), metadata.get("skill_name"), *metadata.get("titles", [])}
+    return {name for name in names if name and len(name) >= MIN_ENTITY_LENGTH}
+
+
+def with_k(retriever, k):
+    """검색 개수만 바꾼 리트리버 사본 (VectorStoreRetriever / CompressedVectorRetriever)"""
+    if hasattr(retriever, "search_kwargs"):
+        return retriever.model_copy(update={"search_kwargs": {**retriever.search_kwargs, "k": k}})
+    return retriever.model_copy(update={"k": k})
+
+
+class AdaptiveRetriever(BaseRetriever):
+    """
+    값싼 신호(BM25 점수 차이, 질문 길이, 가이드/스킬 이름 포함 여부)를 먼저 보고 검색 깊이를 정합니다.
+    - keyword: 이름이 들어간 짧은 질문이고 BM25 1등이 그 이름의 문서로 확실하면 벡터 검색을 건너뜁니다.
+    - wide: 이름도 없고 BM25 점수도 애매하면 각 구간 k를 넓히고 rerank 합니다.
+    - default: 그 외에는 기존 EnsembleRetriever와 같은 Hybrid 검색
+    결정 결과는 문서 metadata["retrieval_class"]에, 클래스별 횟수/지연 시간은 stats()에 남습니다.
+    """
+
+    vector_retriever: BaseRetriever
+    bm25_retriever: BaseRetriever
+    ensemble: BaseRetriever
+    wide_vector_retriever: BaseRetriever
+    reranker: object = None
+    k: int = DEFAULT_K
+    wide_k: int = WIDE_K
+    entities: set = set()
+    class_stats: dict = {}
+    stats_lock: object = None
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    @classmethod
+    def from_retrievers(cls, vector_retriever, bm25_retriever, ensemble, reranker=None,
+                        k=DEFAULT_K, wide_k=WIDE_K):
+        entities = set()
+        for doc in bm25_retriever.docs:
+            entities |= entity_names(doc.metadata)
+        return cls(
+            vector_retriever=vector_retriever,
+            bm25_retriever=bm25_retriever,
+            ensemble=ensemble,
+            wide_vector_retriever=with_k(vector_retriever, wide_k),
+            reranker=reranker,
+            k=k,
+            wide_k=wide_k,
+            entities=entities,
+            class_stats={name: {"count": 0, "seconds": 0.0} for name in (KEYWORD, DEFAULT, WIDE)},
+            stats_lock=threading.Lock()
+        )
+
+    def decide(self, query, scores=None):
+        """
+        검색 클래스를 정하고 BM25 결과까지 미리 계산합니다.
+        scores: 미리 계산한 문서별 BM25 점수 (배치 검색에서 질문들의 토큰 점수를 함께 계산한 경우)
+        반환값: {"class", "bm25_docs", "signals"}
+        """
+        tokens = self.bm25_retriever.preprocess_func(query)
+        if scores is None:
+            scores = self.bm25_retriever.vectorizer.get_scores(tokens) if tokens else np.zeros(1)
+        order = np.argsort(scores)[::-1]
+        top = float(scores[order[0]])
+        second = float(scores[order[1]]) if len(order) > 1 else 0.0
+        margin = (top - second) / top if top > 0 else 0.0
+        hits = {name for name in self.entities if name in query}
+        top_is_hit = top > 0 and bool(entity_names(self.bm25_retriever.docs[order[0]].metadata) & hits)
+
+        if hits and top_is_hit and margin >= KEYWORD_MARGIN and len(tokens) <= KEYWORD_MAX_TOKENS:
+            retrieval_class = KEYWORD
+        elif not hits and (top < WIDE_MIN_SCORE or margin < WIDE_MARGIN):
+            retrieval_class = WIDE
+        else:
+            retrieval_class = DEFAULT
+
+        n = self.wide_k if retrieval_class == WIDE else self.k
+        top_n = order[:n]
+        if retrieval_class == KEYWORD:
+            # 키워드 단독 검색은 점수가 0인 문서(키워드가 하나도 안 맞음)로 k를 채우지 않습니다.
+            top_n = [i for i in top_n if scores[i] > 0]
+        return {
+            "class": retrieval_class,
+            "bm25_docs": [self.bm25_retriever.docs[i] for i in top_n],
+            "signals": {"top_score": top, "margin": margin, "tokens": len(tokens), "entity_hits": sorted(hits)}
+        }
+
+    def vector_retriever_for(self, retrieval_class):
+        """클래스에 맞는 벡터 리트리버. keyword면 None (벡터 검색 생략)"""
+        if retrieval_class == KEYWORD:
+            return None
+        return self.wide_vector_retriever if retrieval_class == WIDE else self.vector_retriever
+
+    def finish(self, query, decision, vector_docs, started):
+        """
+        벡터 결과와 BM25 결과를 합치고(필요하면 rerank) 통계를 남깁니다.
+        started부터 지금까지의 검색 시간은 문서 metadata의 retrieval_ms에도 남깁니다.
+        """
+        retrieval_class = decision["class"]
+        if retrieval_class == KEYWORD:
+            docs = decision["bm25_docs"]
+        else:
+            docs = self.ensemble.weighted_reciprocal_rank([vector_docs, decision["bm25_docs"]])
+            if retrieval_class == WIDE and self.reranker is not None:
+                docs = list(self.reranker.compress_documents(docs, query))
+            docs = docs[:self.k]
+        seconds = time.monotonic() - started
+        self.record(retrieval_class, seconds)
+        retrieval_ms = round(seconds * 1000, 1)
+        return [
+            doc.model_copy(update={"metadata": {**doc.metadata, "retrieval_class": retrieval_class,
+                                                "retrieval_ms": retrieval_ms}})
+            for doc in docs
+        ]
+
+    def record(self, retrieval_class, seconds):
+        with self.stats_lock:
+            entry = self.class_stats[retrieval_class]
+            entry["count"] += 1
+            entry["seconds"] += seconds
+
+    def stats(self):
+        """클래스별 {"count", "share", "avg_ms"}"""
+        with self.stats_lock:
+            total = sum(entry["count"] for entry in self.class_stats.values()) or 1
+            return {
+                name: {
+                    "count": entry["count"],
+                    "share": round(entry["count"] / total, 3),
+                    "avg_ms": round(entry["seconds"] / entry["count"] * 1000, 1) if entry["count"] else 0.0
+                }
+                for name, entry in self.class_stats.items()
+            }
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        started = time.monotonic()
+        decision = self.decide(query)
+        vector_retriever = self.vector_retriever_for(decision["class"])
+        vector_docs = vector_retriever.invoke(query) if vector_retriever is not None else []
+        return self.finish(query, decision, vector_docs, started)
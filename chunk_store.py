@@ -0,0 +1,114 @@
+import os
+import json
+import hashlib
+from langchain_core.documents import Document
+from guide_chunker import GuideChunker
+from near_dedup import collapse_near_duplicates
+
+DATA_DIR = "data"
+DOCS_PATH = os.path.join(DATA_DIR, "guide_docs.json")
+DOCS_JSONL_PATH = os.path.join(DATA_DIR, "guide_docs.jsonl")  # 스트리밍 ingest 결과
+CHUNK_STORE_PATH = os.path.join(DATA_DIR, "guide_chunks.jsonl")
+FRONTIER_FILE = os.path.join(DATA_DIR, "url_frontier.json")  # guide_discovery의 URL 프런티어
+CHUNK_MAX_TOKENS = 800
+
+
+def make_parent_id(doc):
+    """원문 문서의 출처와 내용으로 결정적인 parent ID를 만듭니다."""
+    source = doc.metadata.get("source", "")
+    digest = hashlib.sha1(f"{source}\n{doc.page_content}".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def make_chunk_id(parent_id, start_index, text):
+    """청크 내용 기반 ID. 같은 입력이면 항상 같은 ID가 나옵니다."""
+    digest = hashlib.sha1(f"{parent_id}:{start_index}:{text}".encode("utf-8"))
+    return digest.hexdigest()[:20]
+
+
+def load_source_docs(path=DOCS_PATH):
+    """크롤링 결과 JSON(또는 스트리밍 ingest가 쓰는 JSONL)을 Document 리스트로 읽습니다."""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            data = [json.loads(line) for line in f if line.strip()]
+        else:
+            data = json.load(f)
+    return [Document(page_content=d["page_content"], metadata=d["metadata"]) for d in data]
+
+
+def chunk_documents(docs):
+    """
+    문서를 구조 기반으로 청크로 나누고 chunk_id / parent_id / offset 메타데이터를 붙입니다.
+    Pinecone, BM25 모두 이 결과만 사용해야 합니다.
+    """
+    chunker = GuideChunker(max_tokens=CHUNK_MAX_TOKENS)
+    chunks = []
+    for doc in docs:
+        parent_id = make_parent_id(doc)
+        splits = chunker.split_text(doc.page_content, doc.metadata)
+        for i, (text, start, end, section_path) in enumerate(splits):
+            chunk_id = make_chunk_id(parent_id, start, text)
+            metadata = dict(doc.metadata)
+            metadata.update({
+                "chunk_id": chunk_id,
+                "parent_id": parent_id,
+                "chunk_index": i,
+                "start_index": start,
+                "end_index": end,
+                "section": " > ".join(section_path)
+            })
+            chunks.append(Document(id=chunk_id, page_content=text, metadata=metadata))
+    return chunks
+
+
+def chunk_to_line(chunk):
+    """청크 하나를 청크 저장소의 JSONL 한 줄로 직렬화합니다."""
+    return json.dumps({
+        "id": chunk.metadata["chunk_id"],
+        "page_content": chunk.page_content,
+        "metadata": chunk.metadata
+    }, ensure_ascii=False) + "\n"
+
+
+def save_chunks(chunks, path=CHUNK_STORE_PATH):
+    """청크 저장소(JSONL)에 한 줄에 하나씩 기록합니다."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for chunk in chunks:
+            f.write(chunk_to_line(chunk))
+
+
+def iter_chunks(path=CHUNK_STORE_PATH):
+    """청크 저장소를 한 줄씩 읽어 Document로 돌려줍니다."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            d = json.loads(line)
+            yield Document(id=d["id"], page_content=d["page_content"], metadata=d["metadata"])
+
+
+def load_chunks(path=CHUNK_STORE_PATH):
+    return list(iter_chunks(path))
+
+
+def build_metadata_index(chunks):
+    """chunk_id -> metadata 조회용 인덱스"""
+    return {chunk.metadata["chunk_id"]: chunk.metadata for chunk in chunks}
+
+
+def build_chunk_store(docs, path=CHUNK_STORE_PATH, dedupe=True):
+    """문서 -> 청크 -> 근사 중복 제거 -> 저장까지 한 번에 수행하고 청크 리스트를 반환합니다."""
+    chunks = chunk_documents(docs)
+    if dedupe:
+        chunks, report = collapse_near_duplicates(chunks)
+        print(f"   [+] Near-duplicates collapsed: {report['duplicates']}/{report['total']} chunks "
+              f"({report['ratio']:.1%}) in {report['clusters']} clusters")
+    save_chunks(chunks, path)
+    print(f"   [+] Chunk store saved: {len(docs)} docs -> {len(chunks)} chunks ({path})")
+    return chunks
+
+
+if __name__ == "__main__":
+    # 이미 크롤링된 문서에서 청크 저장소만 다시 만들 때 사용
+    build_chunk_store(load_source_docs(DOCS_JSONL_PATH if os.path.exists(DOCS_JSONL_PATH) else DOCS_PATH))
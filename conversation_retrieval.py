@@ -0,0 +1,142 @@
+import re
+import time
+import numpy as np
+
+from adaptive_retrieval import entity_names
+
+FOLLOW_UP_PREFIXES = ("그럼", "그러면", "그리고", "그건", "그거", "그게", "그것", "그래서", "근데", "그런데", "또",
+                      "이건", "이거", "이것", "저건", "거기", "그 ")
+FOLLOW_UP_MAX_TOKENS = 3   # 접속사/지시어가 없으면 이 이하로 짧은 질문만 후속 질문 후보로 봅니다.
+FOLLOW_UP_MIN_MATCH = 0.5  # 짧은 질문은 캐시된 후보 본문과 글자 bigram이 이 비율 이상 겹쳐야 후속 질문
+MAX_CANDIDATES = 30        # 세션에 남겨두는 후보 청크 수
+TURN_DECAY = 0.5           # 턴이 지날 때마다 이전 점수에 곱하는 값
+MATCH_WEIGHT = 1.0         # 후속 질문과 후보 본문의 글자 bigram 겹침 비율 가중치
+TOP_UP_K = 3               # 후속 질문에서 BM25로 추가로 가져오는 청크 수
+FOLLOW_UP = "follow_up"
+_PUNCT_RE = re.compile(r"[^\w]+")
+
+
+def char_bigrams(text):
+    """공백/문장부호를 뺀 글자 bigram. 조사가 붙은 한국어 질문('쿨타임은?')도 본문과 맞출 수 있습니다."""
+    compact = _PUNCT_RE.sub("", text)
+    return {compact[i:i + 2] for i in range(len(compact) - 1)}
+
+
+def strip_follow_up_prefix(query):
+    for prefix in FOLLOW_UP_PREFIXES:
+        if query.startswith(prefix):
+            return query[len(prefix):].strip()
+    return query.strip()
+
+
+class ConversationRetrievalContext:
+    """
+    세션별 검색 문맥. 이전 턴에서 찾은 후보 청크와 점수를 들고 있다가,
+    후속 질문이면 전체 Hybrid 검색 대신 캐시된 후보를 다시 점수 매기고 BM25로 조금만 보충합니다.
+    - 인덱스 세대가 바뀌면 비웁니다. (다른 코퍼스 버전의 청크와 섞이지 않도록)
+    """
+
+    def __init__(self):
+        self.generation_id = None
+        self.candidates = {}  # chunk_id -> {"doc", "score"}
+        self.topic_entities = set()  # 대화 주제: 이전 질문에 나온 이름 + 1순위 문서의 이름
+        self.stats = {"full": 0, FOLLOW_UP: 0, "full_seconds": 0.0, "follow_up_seconds": 0.0}
+
+    def sync_generation(self, generation_id):
+        if generation_id != self.generation_id:
+            self.generation_id = generation_id
+            self.candidates = {}
+            self.topic_entities = set()
+
+    def is_follow_up(self, query, entities):
+        """
+        값싼 규칙으로 후속 질문인지 판단합니다.
+        - 이전 후보가 있어야 하고
+        - 지금까지의 주제에 없던 새 가이드/스킬 이름이 없어야 하며 (새 이름이면 새 주제)
+        - 접속사/지시어로 시작하거나, 짧은 질문이면서 캐시된 후보 본문과 충분히 겹쳐야 합니다.
+          (한국어 질문은 대부분 짧고 '펫'처럼 짧은 이름은 이름 목록에 없으므로 길이만으로는 판단하지 않습니다)
+        """
+        if not self.candidates:
+            return False
+        query = query.strip()
+        new_entities = {name for name in entities if name in query} - self.topic_entities
+        if new_entities:
+            return False
+        if query.startswith(FOLLOW_UP_PREFIXES):
+            return True
+        if len(query.split()) > FOLLOW_UP_MAX_TOKENS:
+            return False
+        query_bigrams = char_bigrams(query)
+        best = max(self._match(query_bigrams, entry["doc"]) for entry in self.candidates.values())
+        return best >= FOLLOW_UP_MIN_MATCH
+
+    def record(self, docs):
+        """이번 턴의 결과를 후보에 합칩니다. (이전 후보 점수는 감쇠)"""
+        for entry in self.candidates.values():
+            entry["score"] *= TURN_DECAY
+        for rank, doc in enumerate(docs):
+            chunk_id = doc.metadata.get("chunk_id") or doc.page_content
+            score = 1 / (1 + rank)
+            entry = self.candidates.get(chunk_id)
+            if entry is None or entry["score"] < score:
+                self.candidates[chunk_id] = {"doc": doc, "score": score}
+        keep = sorted(self.candidates, key=lambda cid: self.candidates[cid]["score"], reverse=True)[:MAX_CANDIDATES]
+        self.candidates = {cid: self.candidates[cid] for cid in keep}
+
+    def retrieve_follow_up(self, query, bm25_retriever=None, k=5):
+        """
+        캐시된 후보를 후속 질문 기준으로 다시 점수 매기고, BM25로 TOP_UP_K개를 보충합니다.
+        보충 검색어는 후속 질문 + 직전 턴 1순위 문서 제목 (LLM 질문 재작성 없이 주제 유지)
+        """
+        topic = strip_follow_up_prefix(query)
+        query_bigrams = char_bigrams(topic)
+        scored = {}
+        for chunk_id, entry in self.candidates.items():
+            scored[chunk_id] = (entry["score"] + MATCH_WEIGHT * self._match(query_bigrams, entry["doc"]), entry["doc"])
+
+        if bm25_retriever is not None and self.candidates:
+            focus = max(self.candidates.values(), key=lambda entry: entry["score"])["doc"]
+            title = focus.metadata.get("skill_name") or focus.metadata.get("title", "")
+            tokens = bm25_retriever.preprocess_func(f"{topic} {title}")
+            if tokens:
+                scores = bm25_retriever.vectorizer.get_scores(tokens)
+                for rank, i in enumerate(np.argsort(scores)[::-1][:TOP_UP_K]):
+                    if scores[i] <= 0:
+                        break
+                    doc = bm25_retriever.docs[i]
+                    chunk_id = doc.metadata.get("chunk_id") or doc.page_content
+                    score = TURN_DECAY / (1 + rank) + MATCH_WEIGHT * self._match(query_bigrams, doc)
+                    if chunk_id not in scored or scored[chunk_id][0] < score:
+                        scored[chunk_id] = (score, doc)
+
+        ranked = sorted(scored.values(), key=lambda item: item[0], reverse=True)[:k]
+        return [
+            doc.model_copy(update={"metadata": {**doc.metadata, "retrieval_class": FOLLOW_UP}})
+            for _, doc in ranked
+        ]
+
+    @staticmethod
+    def _match(query_bigrams, doc):
+        if not query_bigrams:
+            return 0.0
+        return len(query_bigrams & char_bigrams(doc.page_content)) / len(query_bigrams)
+
+    def retrieve(self, query, retriever, bm25_retriever=None, entities=frozenset(), k=5):
+        """
+        후속 질문이면 캐시 재사용, 아니면 retriever로 전체 검색합니다. 결과는 다음 턴을 위해 기록합니다.
+        bm25_retriever가 없으면(샤드 모드 등) 보충 검색을 할 수 없으므로 항상 전체 검색합니다.
+        """
+        started = time.monotonic()
+        hits = {name for name in entities if name in query}
+        if bm25_retriever is not None and self.is_follow_up(query, entities):
+            docs = self.retrieve_follow_up(query, bm25_retriever, k)
+            kind = FOLLOW_UP
+            self.topic_entities |= hits
+        else:
+            docs = retriever.invoke(query)
+            kind = "full"
+            self.topic_entities = hits | (entity_names(docs[0].metadata) if docs else set())
+        self.record(docs)
+        self.stats[kind] += 1
+        self.stats[f"{kind}_seconds"] += time.monotonic() - started
+        return docs
@@ -1,25 +1,28 @@
 import os
 import time
 import sys
-import re
-import json
 from dotenv import load_dotenv
-from bs4 import BeautifulSoup
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from webdriver_manager.chrome import ChromeDriverManager
-from langchain_core.documents import Document
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
-from langchain_pinecone import PineconeVectorStore
+from ingest_pipeline import run_ingest_pipeline, promote_staged, IngestCheckpoint
+from index_generations import new_generation_id, publish_generation
+from embedding_compression import INDEX_DIR, build_compressed_index
+from guide_shards import load_url_categories
+from remote_clients import get_remote_clients
+from guide_discovery import discover_guide_urls, SeleniumFetcher
 
 DATA_DIR = "data"
 JSON_FILE = os.path.join(DATA_DIR, "guide_docs.json")
 INDEX_NAME = "aion2-guide-rag"
 MODEL_NAME = "text-embedding-3-large"
+EMBEDDING_DIMENSIONS = None  # 축소 차원을 쓰려면 guidebook_rag CONFIG["embedding_dimensions"]와 같게 설정
+SHARDED = False  # locale/카테고리별 namespace로 업로드. guidebook_rag CONFIG["sharded"]와 같게 설정
+MAX_INGEST_RUNS = 3  # 같은 세대로 이만큼 실행해도 실패하는 URL이 남으면 그 URL 없이 세대를 공개합니다.
+COMPRESSED_INDEX = True  # ingest 임베딩으로 압축 인덱스도 만들어 세대에 함께 묶습니다. (CONFIG["vector_backend"]="compressed"용)
 
 def collect_nc_guide_urls(start_id, end_id):
     print(f"[*] Start Collection: CategoryId {start_id} ~ {end_id}")
@@ -56,152 +59,64 @@ def collect_nc_guide_urls(start_id, end_id):
         driver.quit()
     return list(all_urls)
 
-def process_and_save_docs(urls):
+def process_and_save_docs(urls, resume=True):
+    """
+    fetch -> parse -> chunk -> embed -> upsert 스트리밍 파이프라인으로 문서를 저장합니다.
+    중간에 멈춰도 resume=True로 다시 실행하면 끝난 URL은 건너뜁니다.
+    벡터는 새 인덱스 세대의 namespace에 올리고, 모두 끝나면 세대를 publish 해서
+    실행 중인 서버가 재시작 없이 새 코퍼스로 넘어가게 합니다.
+    """
     if not urls:
         print("[!] No URLs provided.")
         return
-    print(f"\n1. Loading and structuring data... ({len(urls)} URLs)")
-    options = webdriver.ChromeOptions()
-    options.add_argument('--headless')
-    options.add_argument("--window-size=1920,1080")
-    options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
-    service = Service(ChromeDriverManager().install())
-    driver = webdriver.Chrome(service=service, options=options)
-    valid_docs = []
-    json_data_list = []
-    try:
-        for url in urls:
-            print(f"   -> Accessing: {url}")
-            driver.get(url)
-            try:
-                wait = WebDriverWait(driver, 10)
-                wait.until(EC.presence_of_element_located((By.CLASS_NAME, "ncgbt-article")))
-                time.sleep(1)
-                soup = BeautifulSoup(driver.page_source, "html.parser")
-                targets = soup.find_all(string=re.compile("보러가기"))
-                for text_node in targets:
-                    parent_link = text_node.find_parent("a")
-                    if parent_link:
-                        parent_link.decompose()
-                    else:
-                        if text_node.parent:
-                            text_node.parent.decompose()
-                title_tag = soup.select_one(".ncgbt-cover-title")
-                title = title_tag.get_text(strip=True) if title_tag else "No Title"
-                desc_tag = soup.select_one(".ncgbt-cover-desc")
-                desc = desc_tag.get_text(strip=True) if desc_tag else "No Description"
-
-                if "스킬" in title and "클래스" not in title:
-                    print(f"      [Skill Parsing] Detected skill page: {title}")
-                    skill_docs = []
-                    article = soup.select_one(".ncgbt-article")
-                    if article:
-                        tables = article.find_all("table")
-                        for table in tables:
-                            section_name = "General Skill"
-                            prev = table.find_previous(["h1", "h2", "h3", "h4", "h5", "h6", "p"])
-                            if prev:
-                                section_name = prev.get_text(strip=True)
-                            
-                            rows = table.find_all("tr")
-                            if not rows: continue
-                            
-                            headers = [th.get_text(strip=True) for th in rows[0].find_all(["td", "th"])]
-                            print(f"      [DEBUG] Headers: {headers}")
-                            
-                            if "명칭" not in headers:
-                                print("      [DEBUG] '명칭' header not found, skipping table")
-                                continue
-                            
-                            try:
-                                name_idx = headers.index("명칭")
-                                desc_idx = headers.index("설명") if "설명" in headers else -1
-                                note_idx = headers.index("비고") if "비고" in headers else -1
-                            except ValueError:
-                                continue
-                                
-                            for row in rows[1:]:
-                                cols = row.find_all("td")
-                                if len(cols) <= name_idx: continue
-                                s_name = cols[name_idx].get_text(separator=" ", strip=True)
-                                s_desc = cols[desc_idx].get_text(separator="\n", strip=True) if desc_idx != -1 and len(cols) > desc_idx else ""
-                                s_note = cols[note_idx].get_text(separator=" ", strip=True) if note_idx != -1 and len(cols) > note_idx else ""
-                                skill_content = f"[{title}] {section_name} - {s_name}\n\nDescription:\n{s_desc}\n\nNote: {s_note}"
-                                skill_metadata = {
-                                    "source": url,
-                                    "title": title,
-                                    "description": desc,
-                                    "skill_name": s_name,
-                                    "skill_type": section_name,
-                                    "category": "skill"
-                                }
-                                doc = Document(page_content=skill_content, metadata=skill_metadata)
-                                valid_docs.append(doc)
-                                json_data_list.append({
-                                    "page_content": skill_content,
-                                    "metadata": skill_metadata
-                                })
-                                skill_docs.append(s_name)
-                        if skill_docs:
-                            print(f"      [+] Structured {len(skill_docs)} skills")
-                            continue
+    checkpoint = IngestCheckpoint()
+    generation_id = (checkpoint.generation if resume and checkpoint.completed else None) or new_generation_id()
+    print(f"   - Pinecone Index: '{INDEX_NAME}' (namespace: '{generation_id}')")
+    clients = get_remote_clients()
+    embeddings = clients.embeddings(MODEL_NAME, dimensions=EMBEDDING_DIMENSIONS)
+    vector_store = clients.vector_store(INDEX_NAME, embeddings, namespace=generation_id)
+    run_ingest_pipeline(
+        urls, SeleniumFetcher(), embeddings, vector_store, resume=resume, generation=generation_id,
+        url_categories=load_url_categories(), sharded=SHARDED
+    )
+    for endpoint, stats in clients.stats().items():
+        print(f"   [*] {endpoint}: {stats}")
 
-                articles = soup.select(".ncgbt-article")
-                body_text = []
-                for article in articles:
-                    text = article.get_text(separator="\n", strip=True)
-                    if text:
-                        body_text.append(text)
-                full_body = "\n\n".join(body_text)
-                if full_body:
-                    enriched_content = f"[{title}] Document.\nSummary: {desc}\n\nContent:\n{full_body}"
-                    metadata = {
-                        "source": url,
-                        "title": title,
-                        "description": desc
-                    }
-                    doc = Document(page_content=enriched_content, metadata=metadata)
-                    valid_docs.append(doc)
-                    json_data_list.append({
-                        "page_content": enriched_content,
-                        "metadata": metadata
-                    })
-                    print(f"      [+] Collected: [{title}]")
-                else:
-                    print("      [-] Empty content")
-            except Exception as e:
-                print(f"      [!] Parsing Error: {e}")
-                continue
-    except Exception as e:
-        print(f"[!] Browser Error: {e}")
-    finally:
-        driver.quit()
-
-    if not valid_docs:
-        print("[!] No documents to save.")
+    checkpoint = IngestCheckpoint()
+    if checkpoint.skipped:
+        # 문서가 없거나 파싱에 실패한 URL은 다시 해도 같으므로 공개를 막지 않습니다.
+        print(f"[-] {len(checkpoint.skipped)} URLs skipped (no documents or parse error)")
+    failed = [url for url in urls if url not in checkpoint.completed]
+    if failed and checkpoint.runs < MAX_INGEST_RUNS:
+        # fetch/임베딩/업로드 실패는 일시적일 수 있어 세대를 공개하지 않습니다. 다시 실행하면 같은 세대로 이어서 처리합니다.
+        print(f"[!] {len(failed)} URLs failed (run {checkpoint.runs}/{MAX_INGEST_RUNS}). "
+              f"Re-run to resume generation '{generation_id}' before publishing.")
         return
-
-    json_filename = "data/guide_docs.json"
-    print(f"\n2. Saving local file... ({json_filename})")
-    try:
-        with open(json_filename, "w", encoding="utf-8") as f:
-            json.dump(json_data_list, f, ensure_ascii=False, indent=4)
-        print(f"   [+] Local save complete!")
-    except Exception as e:
-        print(f"   [!] Local save failed: {e}")
-
-    print("\n3. Splitting text and uploading to Pinecone...")
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    splits = text_splitter.split_documents(valid_docs)
-    print(f"   - Split {len(valid_docs)} docs into {len(splits)} chunks")
-    print(f"   - Pinecone Index: '{INDEX_NAME}'")
-    embeddings = OpenAIEmbeddings(model=MODEL_NAME)
-    try:
-        PineconeVectorStore.from_documents(documents=splits, embedding=embeddings, index_name=INDEX_NAME)
-        print("   [+] Pinecone save complete!")
-    except Exception as e:
-        print(f"   [!] Pinecone save failed: {e}")
+    if failed:
+        print(f"[!] {len(failed)} URLs still failing after {checkpoint.runs} runs, publishing without them:")
+        for url in failed:
+            print(f"   - {url}")
+    # 스테이징에 쌓은 청크 저장소/벡터를 원래 경로로 교체합니다. (실패한 실행은 이전 파일을 건드리지 않음)
+    promote_staged()
+    compressed_index_dir = None
+    if COMPRESSED_INDEX:
+        # 업로드할 때 계산한 임베딩을 그대로 쓰므로 다시 임베딩하지 않습니다.
+        build_compressed_index(directory=INDEX_DIR)
+        compressed_index_dir = INDEX_DIR
+    _, retired = publish_generation(generation_id, compressed_index_dir=compressed_index_dir, namespace=generation_id)
+    checkpoint.reset()  # 다음 수집은 새 세대로 시작
+    for old in retired:
+        # 지난 세대의 벡터 정리 (최근 세대들은 실행 중인 worker가 쓰고 있을 수 있어 남겨둡니다)
+        if not old.get("namespace"):
+            continue
+        namespaces = [old["namespace"]]
+        if SHARDED:
+            namespaces = [ns for ns in vector_store.index.describe_index_stats().get("namespaces", {})
+                          if ns.startswith(old["namespace"] + ".")]
+        for namespace in namespaces:
+            vector_store.index.delete(delete_all=True, namespace=namespace)
 
 if __name__ == "__main__":
-    target_urls = collect_nc_guide_urls(4234, 4244)
+    # 카테고리 범위를 하드코딩하지 않고 사이트 내비게이션에서 찾습니다. (바뀐 카테고리만 재확인)
+    target_urls = discover_guide_urls(SeleniumFetcher())
     process_and_save_docs(target_urls)
\ No newline at end of file
@@ -0,0 +1,270 @@
+import os
+import json
+import argparse
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.retrievers import BaseRetriever
+
+from chunk_store import CHUNK_STORE_PATH, load_chunks
+
+INDEX_DIR = os.path.join("data", "compressed_index")
+VECTORS_PATH = os.path.join("data", "guide_vectors.f32")  # ingest가 계산한 원본 임베딩 (float32 행, ID는 .ids 파일)
+DIMENSIONS = 256           # text-embedding-3 계열은 앞쪽 차원만 잘라 써도 의미가 유지됩니다.
+QUANTIZATION = "int8"      # "float32" | "int8" | "binary"
+RESCORE_CANDIDATES = 50    # 압축 점수로 고른 뒤 원본 벡터로 다시 계산할 후보 수
+EMBED_BATCH_SIZE = 64
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def truncate(vectors, dims):
+    """앞쪽 dims 차원만 남기고 다시 L2 정규화합니다."""
+    vectors = np.asarray(vectors, dtype=np.float32)[..., :dims]
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+class CompressedVectorIndex:
+    """
+    잘라낸 차원 + 양자화된 벡터로 1차 검색하고, 상위 후보만 원본(full precision) 벡터로 재계산합니다.
+    원본 벡터는 디스크에서 mmap으로 열어 후보 행만 읽습니다.
+    """
+
+    def __init__(self, ids, codes, scales, full_vectors, dims, quantization):
+        self.ids = ids
+        self.codes = codes
+        self.scales = scales
+        self.full_vectors = full_vectors
+        self.dims = dims
+        self.quantization = quantization
+
+    @classmethod
+    def from_vectors(cls, ids, vectors, dims=DIMENSIONS, quantization=QUANTIZATION):
+        full = normalize(vectors)
+        reduced = truncate(full, dims)
+        scales = None
+        if quantization == "int8":
+            # 차원별 대칭 스케일 (최댓값을 127에 맞춤)
+            scales = np.maximum(np.abs(reduced).max(axis=0), 1e-12) / 127
+            codes = np.round(reduced / scales).astype(np.int8)
+        elif quantization == "binary":
+            codes = np.packbits(reduced > 0, axis=1)
+        elif quantization == "float32":
+            codes = reduced
+        else:
+            raise ValueError(f"unknown quantization: {quantization}")
+        return cls(list(ids), codes, scales, full, dims, quantization)
+
+    def bytes_per_vector(self, include_full=False):
+        """
+        1차 검색용 코드 크기(메모리에 올라가는 부분).
+        include_full=True면 재정렬용 원본 벡터(full.npy, mmap)까지 더한 디스크 크기
+        """
+        size = self.codes.shape[1] * self.codes.itemsize
+        if include_full and self.full_vectors is not None:
+            size += self.full_vectors.shape[1] * 4
+        return size
+
+    def approximate_scores(self, query_vector):
+        query = truncate(query_vector, self.dims)
+        if self.quantization == "int8":
+            return self.codes.astype(np.float32) @ (query * self.scales)
+        if self.quantization == "binary":
+            query_bits = np.packbits(query > 0)
+            hamming = POPCOUNT[np.bitwise_xor(self.codes, query_bits)].sum(axis=1)
+            return -hamming.astype(np.float32)
+        return self.codes @ query
+
+    def search(self, query_vector, k=5, rescore_candidates=RESCORE_CANDIDATES):
+        """반환값: [(인덱스, 점수)] (점수 내림차순)"""
+        scores = self.approximate_scores(query_vector)
+        n = len(scores)
+        if n == 0:
+            return []
+        if rescore_candidates and self.full_vectors is not None:
+            top = min(max(rescore_candidates, k), n)
+            candidates = np.argpartition(-scores, top - 1)[:top]
+            candidates.sort()  # mmap에서 순서대로 읽도록 정렬
+            exact = np.asarray(self.full_vectors[candidates]) @ normalize(query_vector)
+            order = np.argsort(-exact)[:k]
+            return [(int(candidates[i]), float(exact[i])) for i in order]
+        top = min(k, n)
+        best = np.argpartition(-scores, top - 1)[:top]
+        best = best[np.argsort(-scores[best])]
+        return [(int(i), float(scores[i])) for i in best]
+
+    def save(self, directory=INDEX_DIR):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "codes.npy"), self.codes)
+        np.save(os.path.join(directory, "full.npy"), np.asarray(self.full_vectors, dtype=np.float32))
+        if self.scales is not None:
+            np.save(os.path.join(directory, "scales.npy"), self.scales)
+        with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"ids": self.ids, "dims": self.dims, "quantization": self.quantization}, f)
+
+    @classmethod
+    def load(cls, directory=INDEX_DIR):
+        with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        scales_path = os.path.join(directory, "scales.npy")
+        return cls(
+            meta["ids"],
+            np.load(os.path.join(directory, "codes.npy")),
+            np.load(scales_path) if os.path.exists(scales_path) else None,
+            np.load(os.path.join(directory, "full.npy"), mmap_mode="r"),
+            meta["dims"],
+            meta["quantization"]
+        )
+
+
+class CompressedVectorRetriever(BaseRetriever):
+    """CompressedVectorIndex를 Pinecone 대신 벡터 검색 구간으로 쓰는 리트리버"""
+
+    index: CompressedVectorIndex
+    embeddings: object
+    docs_by_id: dict
+    k: int = 5
+    rescore_candidates: int = RESCORE_CANDIDATES
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return self.search_by_vector(self.embeddings.embed_query(query))
+
+    def search_by_vector(self, query_vector):
+        results = []
+        for i, score in self.index.search(query_vector, self.k, self.rescore_candidates):
+            doc = self.docs_by_id.get(self.index.ids[i])
+            if doc is not None:
+                results.append(doc.model_copy(update={"metadata": {**doc.metadata, "vector_score": score}}))
+        return results
+
+
+def append_vectors(ids, vectors, path=VECTORS_PATH):
+    """ingest가 업로드한 임베딩을 청크 ID와 함께 이어 씁니다. (압축 인덱스를 다시 임베딩하지 않고 만들 때 사용)"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    with open(path, "ab") as f:
+        vectors.tofile(f)
+    with open(path + ".ids", "a", encoding="utf-8") as f:
+        f.writelines(f"{chunk_id}\n" for chunk_id in ids)
+
+
+def reset_vectors(path=VECTORS_PATH):
+    for p in (path, path + ".ids"):
+        open(p, "w").close()
+
+
+def load_vectors(path=VECTORS_PATH):
+    """append_vectors로 쌓은 임베딩을 {chunk_id: 벡터}로 읽습니다. 없으면 {}"""
+    ids_path = path + ".ids"
+    if not os.path.exists(path) or not os.path.exists(ids_path):
+        return {}
+    with open(ids_path, "r", encoding="utf-8") as f:
+        ids = [line.strip() for line in f if line.strip()]
+    if not ids:
+        return {}
+    data = np.fromfile(path, dtype=np.float32)
+    if data.size % len(ids):
+        raise ValueError(f"'{path}' does not match its ids file ({data.size} floats, {len(ids)} ids)")
+    return dict(zip(ids, data.reshape(len(ids), -1)))
+
+
+def embed_chunks(embeddings, chunks, batch_size=EMBED_BATCH_SIZE):
+    vectors = []
+    for i in range(0, len(chunks), batch_size):
+        vectors.extend(embeddings.embed_documents([c.page_content for c in chunks[i:i + batch_size]]))
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def build_compressed_index(embeddings=None, chunks_path=CHUNK_STORE_PATH, directory=INDEX_DIR,
+                           dims=DIMENSIONS, quantization=QUANTIZATION, vectors_path=VECTORS_PATH):
+    """
+    청크 저장소 순서대로 압축 인덱스와 원본 벡터를 저장합니다.
+    벡터는 ingest가 이미 계산한 것(vectors_path)을 쓰고, 없는 청크만 embeddings로 임베딩합니다.
+    """
+    chunks = load_chunks(chunks_path)
+    if not chunks:
+        raise ValueError(f"chunk store is empty: {chunks_path}")
+    known = load_vectors(vectors_path)
+    missing = [c for c in chunks if c.id not in known]
+    if missing:
+        if embeddings is None:
+            raise ValueError(f"{len(missing)} chunks have no ingest vectors in '{vectors_path}'")
+        print(f"[*] Embedding {len(missing)} chunks without ingest vectors")
+        known.update(zip([c.id for c in missing], embed_chunks(embeddings, missing)))
+    vectors = np.stack([known[c.id] for c in chunks])
+    print(f"[*] Building compressed index: {len(chunks)} chunks ({dims} dims, {quantization})")
+    index = CompressedVectorIndex.from_vectors([c.id for c in chunks], vectors, dims, quantization)
+    index.save(directory)
+    # 메모리에는 코드만 올라가지만, 재정렬용 원본 벡터도 디스크에 함께 저장됩니다.
+    print(f"   [+] Saved to {directory}: {index.bytes_per_vector()} bytes/vector in memory, "
+          f"{index.bytes_per_vector(include_full=True)} bytes/vector on disk "
+          f"(uncompressed: {vectors.shape[1] * 4} bytes/vector)")
+    return index
+
+
+def evaluate_recall(ids, vectors, query_vectors, k=5, settings=None, rescore_candidates=RESCORE_CANDIDATES):
+    """
+    압축 설정별 recall@k를 원본 벡터의 정확한 top-k와 비교해 계산합니다.
+    반환값: [{"dims", "quantization", "bytes", "disk_bytes", "recall", "recall_rescored"}]
+    bytes는 1차 검색 코드 크기, disk_bytes는 재정렬용 원본 벡터까지 포함한 크기입니다.
+    """
+    full = normalize(vectors)
+    queries = normalize(query_vectors)
+    baseline = [set(np.argsort(-(full @ q))[:k]) for q in queries]
+    settings = settings or [
+        (dims, quantization)
+        for dims in (64, 128, 256, 512, 1024, full.shape[1])
+        if dims <= full.shape[1]
+        for quantization in ("float32", "int8", "binary")
+    ]
+    rows = []
+    for dims, quantization in settings:
+        index = CompressedVectorIndex.from_vectors(ids, full, dims, quantization)
+        plain, rescored = [], []
+        for q, truth in zip(queries, baseline):
+            plain.append(len(truth & {i for i, _ in index.search(q, k, rescore_candidates=0)}) / k)
+            rescored.append(len(truth & {i for i, _ in index.search(q, k, rescore_candidates)}) / k)
+        rows.append({
+            "dims": dims,
+            "quantization": quantization,
+            "bytes": index.bytes_per_vector(),
+            "disk_bytes": index.bytes_per_vector(include_full=True),
+            "recall": float(np.mean(plain)),
+            "recall_rescored": float(np.mean(rescored))
+        })
+    return rows
+
+
+if __name__ == "__main__":
+    from guidebook_rag import load_models
+
+    parser = argparse.ArgumentParser(description="압축 임베딩 인덱스 생성 / recall@k 측정")
+    parser.add_argument("command", choices=["build", "eval"])
+    parser.add_argument("--dims", type=int, default=DIMENSIONS)
+    parser.add_argument("--quantization", default=QUANTIZATION, choices=["float32", "int8", "binary"])
+    parser.add_argument("--queries", help="질문 목록 파일 (한 줄에 하나). 없으면 문서 제목을 질문으로 사용")
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    load_dotenv()
+    embeddings, _ = load_models()
+    if args.command == "build":
+        build_compressed_index(embeddings, dims=args.dims, quantization=args.quantization)
+    else:
+        index = CompressedVectorIndex.load()
+        if args.queries:
+            with open(args.queries, "r", encoding="utf-8") as f:
+                questions = [line.strip() for line in f if line.strip()]
+        else:
+            questions = sorted({c.metadata.get("skill_name") or c.metadata.get("title", "") for c in load_chunks()})
+        query_vectors = embeddings.embed_documents(questions)
+        print(f"[*] recall@{args.k} vs full precision ({len(questions)} queries, {len(index.ids)} chunks)")
+        print(f"{'dims':>6} {'quant':>8} {'bytes':>7} {'disk':>7} {'recall':>8} {'+rescore':>9}")
+        for row in evaluate_recall(index.ids, index.full_vectors, query_vectors, args.k):
+            print(f"{row['dims']:>6} {row['quantization']:>8} {row['bytes']:>7} {row['disk_bytes']:>7} "
+                  f"{row['recall']:>8.3f} {row['recall_rescored']:>9.3f}")
@@ -0,0 +1,193 @@
+import re
+
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.*)$")
+ENVELOPE_RE = re.compile(r"^\[(?P<title>[^\]]*)\] Document\.\n(?:.*\n)*?Content:\n", re.MULTILINE)
+HANGUL_RE = re.compile(r"[가-힣ㄱ-ㆎ]")
+ROW_SEPARATOR = " | "
+MAX_TOKENS = 800
+
+
+def estimate_tokens(text):
+    """
+    임베딩 모델 토큰 수 근사치.
+    한글 음절은 1토큰, 나머지 문자는 4글자당 1토큰으로 계산합니다.
+    (tiktoken 인코딩 파일 없이도 항상 같은 결과를 내도록 결정적으로 계산)
+    """
+    hangul = len(HANGUL_RE.findall(text))
+    others = len(text) - hangul - text.count(" ")
+    return hangul + (others + 3) // 4
+
+
+def _is_plain_heading(line):
+    """마크업이 없는 옛 크롤링 데이터에서 블록 첫 줄이 소제목인지 추정합니다."""
+    line = line.strip()
+    return 0 < len(line) <= 30 and not line.endswith((".", "다", "요", ":")) and ROW_SEPARATOR not in line
+
+
+class GuideChunker:
+    """
+    크롤링된 가이드 문서의 구조(소제목, 목록, 표 행, 스킬 레코드)를 따라 청크를 만듭니다.
+    - 모든 청크에 [제목]과 섹션 경로를 붙입니다.
+    - 문자 수 대신 토큰 예산(max_tokens) 안에서 섹션 단위로 최대한 채웁니다.
+    - 표가 나뉘면 다음 청크에 헤더 행을 반복합니다.
+    """
+
+    def __init__(self, max_tokens=MAX_TOKENS, length_function=estimate_tokens):
+        self.max_tokens = max_tokens
+        self.length_function = length_function
+
+    def split_text(self, text, metadata=None):
+        """(청크 본문, 원문 시작 offset, 원문 끝 offset, 섹션 경로) 리스트를 반환합니다."""
+        metadata = metadata or {}
+        envelope = ENVELOPE_RE.match(text)
+        if envelope:
+            header = text[:envelope.end()].rstrip("\n")
+            title = envelope.group("title")
+            body_start = envelope.end()
+        else:
+            # 스킬 레코드 등: 첫 줄이 이미 "[제목] ..." 형태의 헤더입니다.
+            first_line_end = text.find("\n")
+            if first_line_end == -1:
+                return [(text, 0, len(text), [])]
+            header = text[:first_line_end]
+            title = metadata.get("title", "")
+            body_start = first_line_end + 1
+
+        sections = self._parse_sections(text, body_start, bool(envelope))
+        return self._pack(sections, header, title, text, body_start)
+
+    def _parse_sections(self, text, body_start, detect_plain_headings):
+        """본문을 섹션 리스트로 나눕니다. 각 섹션은 {path, lines:[(line, start, end)]} 입니다."""
+        sections = []
+        path = []
+        current = {"path": [], "lines": []}
+        offset = body_start
+        block_first_line = True
+        for raw in text[body_start:].split("\n"):
+            start, end = offset, offset + len(raw)
+            offset = end + 1
+            line = raw.strip()
+            if not line:
+                block_first_line = True
+                continue
+
+            match = HEADING_RE.match(line)
+            level = None
+            if match:
+                level = len(match.group(1))
+                heading = match.group(2).strip()
+            elif detect_plain_headings and block_first_line and _is_plain_heading(line):
+                level = 1
+                heading = line
+            block_first_line = False
+
+            if level is not None:
+                if current["lines"]:
+                    sections.append(current)
+                path = path[:level - 1] + [heading]
+                current = {"path": list(path), "lines": []}
+            current["lines"].append((raw, start, end))
+
+        if current["lines"]:
+            sections.append(current)
+        return sections
+
+    def _units(self, section):
+        """섹션을 더 이상 쪼개지 않는 단위(줄, 표 행)로 나누고 표 헤더 행을 함께 돌려줍니다."""
+        units = []
+        table_header = None
+        for raw, start, end in section["lines"]:
+            if ROW_SEPARATOR in raw:
+                if table_header is None:
+                    table_header = raw
+                    units.append((raw, start, end, None))
+                else:
+                    units.append((raw, start, end, table_header))
+            else:
+                table_header = None
+                units.append((raw, start, end, None))
+        return units
+
+    def _pack(self, sections, header, title, text, body_start):
+        chunks = []
+        budget = self.max_tokens
+
+        def prefix_for(path):
+            return f"[{title}] " + " > ".join(path) if path else f"[{title}]"
+
+        state = {"prefix": header, "lines": [], "path": [], "start": None, "end": None}
+
+        def flush():
+            if state["lines"]:
+                body = "\n".join(state["lines"])
+                chunks.append((f"{state['prefix']}\n{body}", state["start"], state["end"], state["path"]))
+            state["lines"] = []
+            state["start"] = None
+
+        def used():
+            return self.length_function("\n".join([state["prefix"]] + state["lines"]))
+
+        def add(line, start, end, path):
+            if state["start"] is None:
+                state["start"] = start
+                state["path"] = path
+            state["lines"].append(line)
+            state["end"] = end
+
+        for section in sections:
+            section_text = "\n".join(raw for raw, _, _ in section["lines"])
+            section_tokens = self.length_function(section_text)
+
+            if used() + section_tokens <= budget:
+                for raw, start, end in section["lines"]:
+                    add(raw, start, end, section["path"])
+                continue
+
+            if state["lines"]:
+                flush()
+                state["prefix"] = prefix_for(section["path"])
+                if self.length_function(state["prefix"]) + section_tokens <= budget:
+                    for raw, start, end in section["lines"]:
+                        add(raw, start, end, section["path"])
+                    continue
+
+            # 섹션 하나가 예산보다 크면 줄/표 행 단위로 나눕니다.
+            state["prefix"] = state["prefix"] if not chunks else prefix_for(section["path"])
+            for raw, start, end, table_header in self._units(section):
+                for piece in self._fit_line(raw):
+                    if state["lines"] and used() + self.length_function(piece) > budget:
+                        flush()
+                        state["prefix"] = prefix_for(section["path"])
+                        if table_header is not None:
+                            state["lines"].append(table_header)
+                    add(piece, start, end, section["path"])
+
+        flush()
+        if not chunks:
+            chunks.append((text, 0, len(text), []))
+        return chunks
+
+    def _fit_line(self, line):
+        """한 줄이 예산을 넘으면 문장 경계 -> 글자 수 순으로 잘라냅니다."""
+        limit = self.max_tokens // 2
+        if self.length_function(line) <= limit:
+            return [line]
+        pieces, current = [], ""
+        for sentence in re.split(r"(?<=[.!?다])\s+", line):
+            candidate = f"{current} {sentence}".strip()
+            if current and self.length_function(candidate) > limit:
+                pieces.append(current)
+                current = sentence
+            else:
+                current = candidate
+        if current:
+            pieces.append(current)
+
+        result = []
+        for piece in pieces:
+            while self.length_function(piece) > limit:
+                cut = max(1, len(piece) * limit // self.length_function(piece))
+                result.append(piece[:cut])
+                piece = piece[cut:]
+            result.append(piece)
+        return result
@@ -0,0 +1,282 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+from bs4 import BeautifulSoup
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from webdriver_manager.chrome import ChromeDriverManager
+from chunk_store import FRONTIER_FILE
+
+BASE_URL = "https://aion2.plaync.com"
+LIST_URL = f"{BASE_URL}/ko-kr/guidebook/list"
+CATEGORY_URL = LIST_URL + "#categoryId={}"
+GUIDE_LINK_CLASS = "ncgbg-guide-depth-2-guide-item-link"
+DEFAULT_CATEGORY_RANGE = (4234, 4244)  # 내비게이션에서 아무것도 못 찾았을 때의 예전 범위
+MAX_AGE_HOURS = 24
+CATEGORY_ID_RE = re.compile(r"categoryId[\"']?\s*[=:]\s*[\"']?(\d+)")
+
+
+def _hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def parse_listing(html, base_url=LIST_URL):
+    """
+    가이드북 목록 페이지에서 카테고리와 가이드 링크를 찾습니다.
+    - 카테고리: categoryId가 들어간 링크/속성/내장 JSON
+    - 가이드: 'view?title=' 링크
+    반환값: {"categories": {id: {"name", "signature"}}, "guides": [url]}
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    categories = {}
+
+    for el in soup.find_all(True):
+        for attr in ("href", "data-category-id"):
+            value = el.get(attr)
+            if not value:
+                continue
+            if attr == "href":
+                match = CATEGORY_ID_RE.search(value)
+                cat_id = match.group(1) if match else None
+            else:
+                cat_id = value if str(value).isdigit() else None
+            if cat_id and cat_id not in categories:
+                # 내비게이션 항목의 텍스트(이름, 글 개수 등)가 바뀌면 카테고리가 바뀐 것으로 봅니다.
+                name = el.get_text(" ", strip=True)
+                categories[cat_id] = {"name": name, "signature": _hash(name)}
+
+    # 스크립트 안에 내장된 목록 데이터(JSON 등)에서만 보이는 카테고리
+    for script in soup.find_all("script"):
+        for cat_id in CATEGORY_ID_RE.findall(script.string or ""):
+            categories.setdefault(cat_id, {"name": "", "signature": ""})
+
+    guides = set()
+    for a in soup.find_all("a", href=True):
+        href = a["href"]
+        if "view?title=" in href:
+            guides.add(urljoin(base_url, href))
+
+    return {"categories": categories, "guides": sorted(guides)}
+
+
+class UrlFrontier:
+    """
+    카테고리/가이드 URL을 last_seen 시각과 함께 파일에 저장합니다.
+    다음 실행에서는 새로 생겼거나, 내비게이션 표시가 바뀌었거나, 오래된 카테고리만 다시 확인합니다.
+    """
+
+    def __init__(self, path=FRONTIER_FILE):
+        self.path = path
+        self.categories = {}
+        self.urls = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.categories = data.get("categories", {})
+            self.urls = data.get("urls", {})
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"categories": self.categories, "urls": self.urls}, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, self.path)
+
+    def due_categories(self, nav_categories, max_age_hours=MAX_AGE_HOURS, now=None):
+        """다시 확인해야 하는 카테고리 ID 목록"""
+        now = now or time.time()
+        due = []
+        for cat_id, info in nav_categories.items():
+            known = self.categories.get(cat_id)
+            if (known is None
+                    or known.get("nav_signature") != info.get("signature")
+                    or now - known.get("last_checked", 0) > max_age_hours * 3600):
+                due.append(cat_id)
+        return sorted(due, key=int)
+
+    def mark_seen_in_nav(self, nav_categories, now=None):
+        now = now or time.time()
+        for cat_id, info in nav_categories.items():
+            entry = self.categories.setdefault(cat_id, {"first_seen": now})
+            entry["name"] = info.get("name") or entry.get("name", "")
+            entry["last_seen"] = now
+
+    def record_category(self, cat_id, guide_urls, nav_signature=None, now=None):
+        """
+        카테고리를 확인한 결과를 기록합니다. 반환값: (새로 발견된 URL 수, 사라진 URL 수)
+        이 카테고리에 있던 URL이 새 목록에 없으면 삭제된 가이드로 보고 gone_since를 남깁니다.
+        """
+        now = now or time.time()
+        entry = self.categories.setdefault(cat_id, {"first_seen": now})
+        entry["last_checked"] = now
+        entry["last_seen"] = now
+        entry["guide_count"] = len(guide_urls)
+        entry["fingerprint"] = _hash("\n".join(sorted(guide_urls)))
+        if nav_signature is not None:
+            entry["nav_signature"] = nav_signature
+        new_count = 0
+        for url in guide_urls:
+            url_entry = self.urls.get(url)
+            if url_entry is None:
+                url_entry = self.urls[url] = {"first_seen": now}
+                new_count += 1
+            url_entry["category_id"] = cat_id
+            url_entry["last_seen"] = now
+            url_entry.pop("gone_since", None)
+        listed = set(guide_urls)
+        gone_count = 0
+        for url, url_entry in self.urls.items():
+            if url_entry.get("category_id") == cat_id and url not in listed and "gone_since" not in url_entry:
+                url_entry["gone_since"] = now
+                gone_count += 1
+        return new_count, gone_count
+
+    def known_urls(self, max_age_hours=None, now=None):
+        """
+        아직 살아 있는 가이드 URL. (목록에서 사라진 URL은 제외)
+        max_age_hours를 주면 그 안에 다시 본 URL만 돌려줍니다.
+        """
+        now = now or time.time()
+        return sorted(
+            url for url, entry in self.urls.items()
+            if "gone_since" not in entry
+            and (max_age_hours is None or now - entry.get("last_seen", 0) <= max_age_hours * 3600)
+        )
+
+
+class SavedPageFetcher:
+    """
+    저장해둔 목록 페이지로 동작하는 오프라인 fetcher.
+    디렉터리 구성: list.html (루트 목록), category_<id>.html (카테고리별 목록)
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def fetch(self, url, wait_class=None):
+        match = CATEGORY_ID_RE.search(url)
+        name = f"category_{match.group(1)}.html" if match else "list.html"
+        path = os.path.join(self.directory, name)
+        if not os.path.exists(path):
+            return ""
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def close(self):
+        pass
+
+
+class SeleniumFetcher:
+    """스레드마다 Chrome 드라이버를 하나씩 두고 렌더링된 페이지 소스를 가져옵니다."""
+
+    def __init__(self, headless=True, wait_seconds=10, settle_seconds=1):
+        self.headless = headless
+        self.wait_seconds = wait_seconds
+        self.settle_seconds = settle_seconds
+        self._local = threading.local()
+        self._drivers = []
+        self._lock = threading.Lock()
+
+    def _driver(self):
+        driver = getattr(self._local, "driver", None)
+        if driver is None:
+            options = webdriver.ChromeOptions()
+            if self.headless:
+                options.add_argument('--headless')
+            options.add_argument("--window-size=1920,1080")
+            options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
+            with self._lock:
+                service = Service(ChromeDriverManager().install())
+                driver = webdriver.Chrome(service=service, options=options)
+                self._drivers.append(driver)
+            self._local.driver = driver
+        return driver
+
+    def fetch(self, url, wait_class=None):
+        driver = self._driver()
+        driver.get(url)
+        try:
+            # wait_class가 없으면 카테고리 페이지는 가이드 링크, 루트 페이지는 카테고리 링크를 기다립니다.
+            if wait_class:
+                locator = (By.CLASS_NAME, wait_class)
+            elif "categoryId=" in url:
+                locator = (By.CLASS_NAME, GUIDE_LINK_CLASS)
+            else:
+                locator = (By.CSS_SELECTOR, "a[href*='categoryId=']")
+            WebDriverWait(driver, self.wait_seconds).until(EC.presence_of_element_located(locator))
+            time.sleep(self.settle_seconds) # 렌더링 안정화
+        except Exception:
+            pass
+        return driver.page_source
+
+    def close(self):
+        with self._lock:
+            for driver in self._drivers:
+                driver.quit()
+            self._drivers = []
+
+
+def discover_guide_urls(fetcher, frontier=None, max_workers=4, max_age_hours=MAX_AGE_HOURS):
+    """
+    사이트 내비게이션에서 카테고리를 찾고, 바뀐 카테고리만 병렬로 다시 확인합니다.
+    반환값: 알려진 가이드 URL 중 목록에서 사라지지 않은 URL 리스트
+    """
+    frontier = frontier or UrlFrontier()
+    print(f"[*] Discovering categories from {LIST_URL}")
+    listing = parse_listing(fetcher.fetch(LIST_URL))
+    nav_categories = listing["categories"]
+    if not nav_categories:
+        known = {cat_id: {"name": e.get("name", ""), "signature": e.get("nav_signature")}
+                 for cat_id, e in frontier.categories.items()}
+        start_id, end_id = DEFAULT_CATEGORY_RANGE
+        fallback = {str(i): {"name": "", "signature": None} for i in range(start_id, end_id + 1)}
+        nav_categories = {**fallback, **known}
+        print(f"   [-] No categories in navigation, falling back to {len(nav_categories)} known categories")
+    else:
+        print(f"   [+] Found {len(nav_categories)} categories in navigation")
+
+    frontier.mark_seen_in_nav(nav_categories)
+    due = frontier.due_categories(nav_categories, max_age_hours)
+    print(f"   [*] {len(due)} categories to (re)check, {len(nav_categories) - len(due)} unchanged")
+
+    def check(cat_id):
+        try:
+            html = fetcher.fetch(CATEGORY_URL.format(cat_id))
+            return cat_id, parse_listing(html)["guides"]
+        except Exception as e:
+            print(f"   [!] Category {cat_id} fetch failed: {e}")
+            return cat_id, []
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for cat_id, guides in executor.map(check, due):
+                if not guides:
+                    # 로딩 실패일 수 있으므로 확인 시각을 남기지 않고 다음 실행에서 다시 확인합니다.
+                    print(f"   [-] No posts or loading failed for Category {cat_id}")
+                    continue
+                new_count, gone_count = frontier.record_category(cat_id, guides, nav_categories[cat_id].get("signature"))
+                print(f"   [+] Category {cat_id}: {len(guides)} guides ({new_count} new, {gone_count} gone)")
+    finally:
+        fetcher.close()
+        frontier.save()
+
+    urls = frontier.known_urls()
+    print(f"[*] Known guide URLs: {len(urls)}")
+    return urls
+
+
+if __name__ == "__main__":
+    import sys
+    # python guide_discovery.py [저장된 목록 페이지 디렉터리]
+    if len(sys.argv) > 1:
+        discover_guide_urls(SavedPageFetcher(sys.argv[1]))
+    else:
+        discover_guide_urls(SeleniumFetcher())
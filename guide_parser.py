@@ -0,0 +1,148 @@
+import re
+from bs4 import BeautifulSoup, Comment
+from langchain_core.documents import Document
+
+HEADING_TAGS = ["h1", "h2", "h3", "h4", "h5", "h6"]
+BLOCK_TAGS = HEADING_TAGS + ["tr", "li", "p", "div", "dt", "dd"]
+
+def article_to_text(article):
+    """
+    기사 본문을 구조가 남아있는 텍스트로 변환합니다.
+    소제목은 "## 제목", 목록은 "- 항목", 표 행은 "셀 | 셀 | 셀" 한 줄로 만듭니다.
+    (guide_chunker가 이 표기를 보고 섹션/표 경계를 나눕니다)
+    """
+    lines = []
+    current_block = None
+    current_cell = None
+    current_inner = None
+    parts = []
+
+    def flush():
+        if not parts:
+            return
+        text = " ".join("".join(parts).split())
+        if current_block is not None and current_block.name in HEADING_TAGS:
+            text = "#" * int(current_block.name[1]) + " " + text
+        elif current_block is not None and current_block.name == "li":
+            text = "- " + text
+        lines.append(text)
+
+    for node in article.find_all(string=True):
+        if isinstance(node, Comment) or node.parent.name in ("script", "style"):
+            continue
+        text = node.strip()
+        if not text:
+            continue
+        inner = node.find_parent(BLOCK_TAGS)
+        row = node.find_parent("tr")
+        # <li><p>…</p></li>처럼 목록 안에 블록이 있어도 목록 항목 한 줄("- ")로 묶습니다.
+        item = node.find_parent("li") if row is None else None
+        block = row if row is not None else item if item is not None else inner
+        cell = node.find_parent(["td", "th"]) if row is not None else None
+        # 구분자 뒤에도 원래 공백을 남겨야 다음 인라인 태그와 단어가 붙지 않습니다. (공백 정리는 flush에서)
+        if block is not current_block:
+            flush()
+            parts = [str(node)]
+            current_block = block
+            current_cell = cell
+        elif cell is not current_cell:
+            parts.append(" | " + str(node))
+            current_cell = cell
+        elif inner is not current_inner:
+            parts.append(" " + str(node))
+        else:
+            # 인라인 태그(<b>, <span> 등)는 원래 공백을 그대로 이어 붙입니다.
+            parts.append(str(node))
+        current_inner = inner
+    flush()
+    return "\n".join(lines)
+
+def parse_guide_page(html, url):
+    """
+    가이드 페이지 HTML을 Document 리스트로 변환합니다.
+    스킬 페이지는 스킬 하나당 Document 하나, 일반 가이드는 페이지당 Document 하나입니다.
+    """
+    docs = []
+    soup = BeautifulSoup(html, "html.parser")
+    targets = soup.find_all(string=re.compile("보러가기"))
+    for text_node in targets:
+        parent_link = text_node.find_parent("a")
+        if parent_link:
+            parent_link.decompose()
+        else:
+            if text_node.parent:
+                text_node.parent.decompose()
+    title_tag = soup.select_one(".ncgbt-cover-title")
+    title = title_tag.get_text(strip=True) if title_tag else "No Title"
+    desc_tag = soup.select_one(".ncgbt-cover-desc")
+    desc = desc_tag.get_text(strip=True) if desc_tag else "No Description"
+
+    if "스킬" in title and "클래스" not in title:
+        print(f"      [Skill Parsing] Detected skill page: {title}")
+        skill_docs = []
+        article = soup.select_one(".ncgbt-article")
+        if article:
+            tables = article.find_all("table")
+            for table in tables:
+                section_name = "General Skill"
+                prev = table.find_previous(["h1", "h2", "h3", "h4", "h5", "h6", "p"])
+                if prev:
+                    section_name = prev.get_text(strip=True)
+                
+                rows = table.find_all("tr")
+                if not rows: continue
+                
+                headers = [th.get_text(strip=True) for th in rows[0].find_all(["td", "th"])]
+                print(f"      [DEBUG] Headers: {headers}")
+                
+                if "명칭" not in headers:
+                    print("      [DEBUG] '명칭' header not found, skipping table")
+                    continue
+                
+                try:
+                    name_idx = headers.index("명칭")
+                    desc_idx = headers.index("설명") if "설명" in headers else -1
+                    note_idx = headers.index("비고") if "비고" in headers else -1
+                except ValueError:
+                    continue
+                    
+                for row in rows[1:]:
+                    cols = row.find_all("td")
+                    if len(cols) <= name_idx: continue
+                    s_name = cols[name_idx].get_text(separator=" ", strip=True)
+                    s_desc = cols[desc_idx].get_text(separator="\n", strip=True) if desc_idx != -1 and len(cols) > desc_idx else ""
+                    s_note = cols[note_idx].get_text(separator=" ", strip=True) if note_idx != -1 and len(cols) > note_idx else ""
+                    skill_content = f"[{title}] {section_name} - {s_name}\n\nDescription:\n{s_desc}\n\nNote: {s_note}"
+                    skill_metadata = {
+                        "source": url,
+                        "title": title,
+                        "description": desc,
+                        "skill_name": s_name,
+                        "skill_type": section_name,
+                        "category": "skill"
+                    }
+                    docs.append(Document(page_content=skill_content, metadata=skill_metadata))
+                    skill_docs.append(s_name)
+            if skill_docs:
+                print(f"      [+] Structured {len(skill_docs)} skills")
+                return docs
+
+    articles = soup.select(".ncgbt-article")
+    body_text = []
+    for article in articles:
+        text = article_to_text(article)
+        if text:
+            body_text.append(text)
+    full_body = "\n\n".join(body_text)
+    if full_body:
+        enriched_content = f"[{title}] Document.\nSummary: {desc}\n\nContent:\n{full_body}"
+        metadata = {
+            "source": url,
+            "title": title,
+            "description": desc
+        }
+        docs.append(Document(page_content=enriched_content, metadata=metadata))
+        print(f"      [+] Collected: [{title}]")
+    else:
+        print("      [-] Empty content")
+    return docs
@@ -0,0 +1,201 @@
+import os
+import re
+import json
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.retrievers import BaseRetriever
+
+from chunk_store import DATA_DIR, CHUNK_STORE_PATH, FRONTIER_FILE, iter_chunks, load_chunks, chunk_to_line
+from adaptive_retrieval import entity_names
+
+SHARDS_DIR = os.path.join(DATA_DIR, "shards")
+SHARD_MANIFEST = "shards.json"
+DEFAULT_LOCALE = "ko-kr"
+MISC_CATEGORY = "misc"     # 프런티어에 카테고리 정보가 없는 URL
+MAX_SHARDS = 3             # 이름이 안 맞는 질문을 키워드로 라우팅할 때 최대 샤드 수
+RRF_K = 60
+LOCALE_RE = re.compile(r"/([a-z]{2}-[a-z]{2})/")
+
+
+def locale_from_url(url):
+    match = LOCALE_RE.search(url or "")
+    return match.group(1) if match else DEFAULT_LOCALE
+
+
+def shard_key(metadata):
+    """locale/category_id 형태의 샤드 키 (예: 'ko-kr/4234')"""
+    return f"{metadata.get('locale') or DEFAULT_LOCALE}/{metadata.get('category_id') or MISC_CATEGORY}"
+
+
+def shard_namespace(key, base=None):
+    """샤드의 Pinecone namespace. base는 인덱스 세대 namespace"""
+    name = key.replace("/", ".")
+    return f"{base}.{name}" if base else name
+
+
+def load_url_categories(path=FRONTIER_FILE):
+    """URL 프런티어(guide_discovery.py)에서 가이드 URL -> 카테고리 ID 매핑을 읽습니다."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        urls = json.load(f).get("urls", {})
+    return {url: entry["category_id"] for url, entry in urls.items() if entry.get("category_id")}
+
+
+def load_category_names(path=FRONTIER_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        categories = json.load(f).get("categories", {})
+    return {cat_id: entry.get("name", "") for cat_id, entry in categories.items()}
+
+
+def annotate_shard(metadata, url_categories):
+    """문서/청크 metadata에 locale, category_id를 채웁니다. (이미 있으면 유지)"""
+    source = metadata.get("source", "")
+    metadata.setdefault("locale", locale_from_url(source))
+    if not metadata.get("category_id"):
+        metadata["category_id"] = url_categories.get(source) or MISC_CATEGORY
+    return metadata
+
+
+def write_shards(chunks_path=CHUNK_STORE_PATH, directory=SHARDS_DIR, url_categories=None, category_names=None):
+    """
+    청크 저장소를 샤드별 청크 저장소(<locale>/<category_id>.jsonl)로 나눠 씁니다.
+    반환값: {샤드 키: {"locale", "category_id", "name", "path", "chunks"}} (shards.json에도 저장)
+    """
+    url_categories = load_url_categories() if url_categories is None else url_categories
+    category_names = load_category_names() if category_names is None else category_names
+    os.makedirs(directory, exist_ok=True)
+    shards, files = {}, {}
+    try:
+        for chunk in iter_chunks(chunks_path):
+            annotate_shard(chunk.metadata, url_categories)
+            key = shard_key(chunk.metadata)
+            if key not in files:
+                locale, category_id = key.split("/")
+                path = os.path.join(directory, locale, f"{category_id}.jsonl")
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                files[key] = open(path, "w", encoding="utf-8")
+                shards[key] = {
+                    "locale": locale,
+                    "category_id": category_id,
+                    "name": category_names.get(category_id, ""),
+                    "path": os.path.relpath(path, directory),
+                    "chunks": 0
+                }
+            files[key].write(chunk_to_line(chunk))
+            shards[key]["chunks"] += 1
+    finally:
+        for f in files.values():
+            f.close()
+
+    with open(os.path.join(directory, SHARD_MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(shards, f, ensure_ascii=False, indent=4)
+    print(f"   [+] Wrote {len(shards)} shards to {directory}")
+    return shards
+
+
+def load_shard_manifest(directory=SHARDS_DIR):
+    path = os.path.join(directory, SHARD_MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        shards = json.load(f)
+    for info in shards.values():
+        info["path"] = os.path.join(directory, info["path"])
+    return shards
+
+
+def reciprocal_rank_fusion(doc_lists, id_key="chunk_id", k=RRF_K):
+    """여러 샤드의 결과를 순위 기반(RRF)으로 합칩니다."""
+    scores, docs = {}, {}
+    for doc_list in doc_lists:
+        for rank, doc in enumerate(doc_list):
+            doc_id = doc.metadata.get(id_key) or doc.page_content
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1 / (k + rank + 1)
+            docs.setdefault(doc_id, doc)
+    return [docs[doc_id] for doc_id in sorted(scores, key=scores.get, reverse=True)]
+
+
+class Shard:
+    """샤드 하나의 리트리버와 라우팅용 정보(이름 목록, 키워드 어휘)"""
+
+    def __init__(self, key, info, retriever, docs):
+        self.key = key
+        self.locale = info["locale"]
+        self.category_id = info["category_id"]
+        self.retriever = retriever
+        self.entities = set()
+        self.vocabulary = set()
+        for doc in docs:
+            self.entities |= entity_names(doc.metadata)
+            self.vocabulary.update(doc.page_content.split())
+        if len(info.get("name") or "") >= 2:
+            self.entities.add(info["name"])
+
+
+class ShardRouter(BaseRetriever):
+    """
+    질문을 관련 샤드에만 보내고, 여러 샤드가 맞으면 병렬로 검색해 RRF로 합칩니다.
+    1. locale: locales에 있는 샤드만 대상
+    2. 가이드/스킬/카테고리 이름이 질문에 있으면 그 이름을 가진 샤드만
+    3. 없으면 질문 키워드가 어휘에 많이 겹치는 상위 max_shards개 샤드
+    4. 그래도 없으면 해당 locale의 모든 샤드
+    """
+
+    shards: dict
+    locales: list = [DEFAULT_LOCALE]
+    max_shards: int = MAX_SHARDS
+    k: int = 5
+    executor: object = None
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def route(self, query):
+        candidates = [s for s in self.shards.values() if s.locale in self.locales]
+        hits = [s for s in candidates if any(name in query for name in s.entities)]
+        if hits:
+            return hits
+        tokens = set(query.split())
+        overlaps = sorted(((len(tokens & s.vocabulary), s) for s in candidates), key=lambda x: -x[0])
+        keyword_hits = [s for overlap, s in overlaps if overlap > 0][:self.max_shards]
+        return keyword_hits or candidates
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        routed = self.route(query)
+        if not routed:
+            return []  # locales에 해당하는 샤드가 없음
+        if len(routed) == 1:
+            results = [routed[0].retriever.invoke(query)]
+        else:
+            results = list(self.executor.map(lambda s: s.retriever.invoke(query), routed))
+        shard_of = {}
+        for shard, docs in zip(routed, results):
+            for doc in docs:
+                shard_of.setdefault(doc.metadata.get("chunk_id"), shard.key)
+        merged = reciprocal_rank_fusion(results)[:self.k] if len(results) > 1 else results[0][:self.k]
+        return [
+            doc.model_copy(update={"metadata": {**doc.metadata, "shard": shard_of.get(doc.metadata.get("chunk_id"))}})
+            for doc in merged
+        ]
+
+
+def build_shard_router(shards_info, build_shard_retriever, locales=None, max_workers=4):
+    """
+    shards_info: load_shard_manifest 결과
+    build_shard_retriever(key, docs): 샤드 하나의 리트리버를 만드는 함수
+    """
+    shards = {}
+    for key, info in shards_info.items():
+        docs = load_chunks(info["path"])
+        shards[key] = Shard(key, info, build_shard_retriever(key, docs), docs)
+    return ShardRouter(
+        shards=shards,
+        locales=locales or [DEFAULT_LOCALE],
+        executor=ThreadPoolExecutor(max_workers=max_workers)
+    )
+
+
+if __name__ == "__main__":
+    # 청크 저장소 + URL 프런티어로 샤드별 청크 저장소를 만듭니다.
+    write_shards()
@@ -0,0 +1,432 @@
+import os
+import time
+import asyncio
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from aiohttp import web
+from dotenv import load_dotenv
+
+from guidebook_rag import load_models, build_retrievers, get_answer_chain
+from index_generations import GenerationManager
+from adaptive_retrieval import AdaptiveRetriever
+from guide_shards import ShardRouter
+
+API_CONFIG = {
+    "host": "0.0.0.0",
+    "port": 8000,
+    "workers": 2,              # 인덱스를 하나씩 들고 있는 worker 프로세스 수
+    "max_batch_size": 8,       # 한 번에 worker로 보내는 최대 질문 수
+    "max_wait_ms": 20,         # 배치를 채우기 위해 기다리는 최대 시간
+    "max_pending": 64,         # 대기열 한도. 넘으면 503으로 거절 (admission control)
+    "batches_per_worker": 1,   # worker당 동시에 처리하는 배치 수
+    "llm_concurrency": 8,      # 배치 안에서 동시에 보내는 LLM 요청 수
+    "request_timeout": 60
+}
+
+
+# === Worker 프로세스 ===
+
+def bm25_batch_scores(retriever, queries):
+    """
+    여러 질문의 문서별 BM25 점수를 한 번에 계산합니다.
+    배치 안에서 겹치는 토큰의 문서별 점수는 한 번만 계산합니다. (rank_bm25 BM25Okapi와 같은 수식)
+    """
+    bm25 = retriever.vectorizer
+    doc_len = np.array(bm25.doc_len)
+    norm = bm25.k1 * (1 - bm25.b + bm25.b * doc_len / bm25.avgdl)
+    term_cache = {}
+    results = []
+    for query in queries:
+        scores = np.zeros(len(retriever.docs))
+        for token in retriever.preprocess_func(query):
+            if token not in term_cache:
+                freq = np.array([doc.get(token, 0) for doc in bm25.doc_freqs])
+                term_cache[token] = (bm25.idf.get(token) or 0) * (freq * (bm25.k1 + 1) / (freq + norm))
+            scores += term_cache[token]
+        results.append(scores)
+    return results
+
+
+def bm25_batch_search(retriever, queries):
+    """여러 질문의 BM25 상위 k개 문서를 한 번에 찾습니다."""
+    return [
+        [retriever.docs[i] for i in np.argsort(scores)[::-1][:retriever.k]]
+        for scores in bm25_batch_scores(retriever, queries)
+    ]
+
+
+class BatchRetriever:
+    """get_rag_chain과 같은 Hybrid 구성을 질문 배치 단위로 실행합니다."""
+
+    def __init__(self, embeddings, vector_retriever, bm25_retriever, base_retriever):
+        self.embeddings = embeddings
+        self.vector_retriever = vector_retriever
+        self.bm25_retriever = bm25_retriever
+        self.base_retriever = base_retriever
+
+    @staticmethod
+    def search_by_vectors(vector_retriever, vectors):
+        if hasattr(vector_retriever, "search_by_vector"):
+            # 압축 인덱스 (CompressedVectorRetriever)
+            return [vector_retriever.search_by_vector(v) for v in vectors]
+        k = vector_retriever.search_kwargs.get("k", 4)
+        vector_store = vector_retriever.vectorstore
+        return [vector_retriever.with_metadata(vector_store.similarity_search_by_vector(v, k=k)) for v in vectors]
+
+    def retrieve(self, questions):
+        if isinstance(self.base_retriever, ShardRouter):
+            # 질문마다 라우팅되는 샤드가 달라서 샤드 라우터가 질문별로 fan-out 합니다.
+            return self.base_retriever.batch(questions)
+        if isinstance(self.base_retriever, AdaptiveRetriever):
+            return self.retrieve_adaptive(questions)
+        # 질문 임베딩은 한 번의 API 호출로 처리
+        vectors = self.embeddings.embed_documents(questions)
+        vector_results = self.search_by_vectors(self.vector_retriever, vectors)
+        if self.bm25_retriever is None:
+            return vector_results
+
+        bm25_results = bm25_batch_search(self.bm25_retriever, questions)
+        # EnsembleRetriever와 동일한 가중 RRF로 합칩니다.
+        return [
+            self.base_retriever.weighted_reciprocal_rank([v, b])
+            for v, b in zip(vector_results, bm25_results)
+        ]
+
+    def retrieve_adaptive(self, questions):
+        """
+        AdaptiveRetriever의 결정을 배치로 적용합니다. 벡터 검색이 필요한 질문만 임베딩합니다.
+        검색 시간은 질문마다 자기 경로만 잽니다. 함께 계산한 BM25 점수/임베딩 호출은 질문 수로 나눠 더하고,
+        keyword 질문은 임베딩 호출 전에 끝냅니다.
+        """
+        adaptive = self.base_retriever
+        # 질문별 결정도 배치 BM25 점수(겹치는 토큰은 한 번만 계산)로 내립니다.
+        started = time.monotonic()
+        scores = bm25_batch_scores(adaptive.bm25_retriever, questions)
+        shared = (time.monotonic() - started) / len(questions)
+        decisions, spent = [], []
+        for q, s in zip(questions, scores):
+            started = time.monotonic()
+            decisions.append(adaptive.decide(q, s))
+            spent.append(shared + time.monotonic() - started)
+
+        results = [None] * len(questions)
+        indices = []
+        for i, (q, d) in enumerate(zip(questions, decisions)):
+            if adaptive.vector_retriever_for(d["class"]) is None:
+                results[i] = adaptive.finish(q, d, [], time.monotonic() - spent[i])
+            else:
+                indices.append(i)
+        if indices:
+            started = time.monotonic()
+            vectors = self.embeddings.embed_documents([questions[i] for i in indices])
+            embed_share = (time.monotonic() - started) / len(indices)
+            for i, vector in zip(indices, vectors):
+                started = time.monotonic()
+                vector_retriever = adaptive.vector_retriever_for(decisions[i]["class"])
+                vector_docs = self.search_by_vectors(vector_retriever, [vector])[0]
+                results[i] = adaptive.finish(questions[i], decisions[i], vector_docs,
+                                             started - spent[i] - embed_share)
+        return results
+
+
+class GuidebookWorker:
+    """
+    프로세스당 한 번만 인덱스/모델을 로딩하고 읽기 전용으로 공유합니다.
+    새 인덱스 세대가 올라오면 백그라운드에서 리트리버를 새로 만들어 배치 사이에 교체합니다.
+    """
+
+    def __init__(self, llm_concurrency=API_CONFIG["llm_concurrency"]):
+        load_dotenv()
+        embeddings, model = load_models()
+        self.retrievers = GenerationManager(
+            lambda generation: BatchRetriever(embeddings, *build_retrievers(embeddings, generation))
+        ).start()
+        self.answer_chain = get_answer_chain(model)
+        self.llm_concurrency = llm_concurrency
+
+    def answer_batch(self, requests):
+        questions = [r["question"] for r in requests]
+        # 배치 하나는 같은 세대의 인덱스로만 검색합니다.
+        with self.retrievers.acquire() as retriever:
+            contexts = retriever.retrieve(questions)
+        inputs = [
+            {"context": context, "question": r["question"], "chat_history": r.get("chat_history", "")}
+            for r, context in zip(requests, contexts)
+        ]
+        results = self.answer_chain.batch(
+            inputs,
+            config={"max_concurrency": self.llm_concurrency},
+            return_exceptions=True
+        )
+        return [serialize_result(result) for result in results]
+
+
+def serialize_result(result):
+    if isinstance(result, Exception):
+        return {"error": str(result)}
+    first = result["context"][0].metadata if result["context"] else {}
+    return {
+        "answer": result["answer"],
+        "retrieval_class": first.get("retrieval_class"),
+        "retrieval_ms": first.get("retrieval_ms"),
+        "sources": [
+            {
+                "title": doc.metadata.get("title", "제목 없음"),
+                "source": doc.metadata.get("source", ""),
+                "chunk_id": doc.metadata.get("chunk_id"),
+                "score": doc.metadata.get("relevance_score", 0)
+            }
+            for doc in result["context"]
+        ]
+    }
+
+
+_worker = None
+
+def _init_worker(llm_concurrency):
+    global _worker
+    _worker = GuidebookWorker(llm_concurrency)
+
+def _run_batch(requests):
+    return _worker.answer_batch(requests)
+
+def _ping():
+    return os.getpid()
+
+
+# === HTTP 프로세스 ===
+
+class Overloaded(Exception):
+    """대기열이 가득 차서 요청을 받을 수 없을 때 발생합니다."""
+
+    def __init__(self, retry_after):
+        super().__init__("server overloaded")
+        self.retry_after = retry_after
+
+
+class MicroBatcher:
+    """
+    동시에 들어온 요청을 모아 worker 프로세스에 배치로 보냅니다.
+    - max_wait_ms 동안 또는 max_batch_size가 찰 때까지 모읍니다.
+    - 처리 중인 배치 수는 max_in_flight로 제한합니다. (LLM 구간 포화 시 대기열이 쌓임)
+    - 대기열이 max_pending을 넘으면 새 요청은 바로 거절합니다. (backpressure)
+    """
+
+    def __init__(self, run_batch, max_batch_size, max_wait_ms, max_pending, max_in_flight):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_pending = max_pending
+        self.max_in_flight = max_in_flight
+        self.queue = asyncio.Queue()
+        self.in_flight = 0
+        self.batch_latency = 1.0  # EWMA (초)
+        self.stats = {"accepted": 0, "rejected": 0, "batches": 0, "batched_requests": 0}
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._task = None
+        self._batch_tasks = set()  # 실행 중인 배치 task (참조를 들고 있어야 GC되지 않습니다)
+
+    def start(self):
+        self._task = asyncio.create_task(self._dispatch_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+        for task in list(self._batch_tasks):
+            task.cancel()
+        await asyncio.gather(*self._batch_tasks, return_exceptions=True)
+
+    def retry_after(self):
+        """현재 대기열을 비우는 데 걸릴 예상 시간(초)"""
+        batches_ahead = self.queue.qsize() / self.max_batch_size / self.max_in_flight
+        return max(1, int(batches_ahead * self.batch_latency) + 1)
+
+    async def submit(self, payload):
+        if self.queue.qsize() >= self.max_pending:
+            self.stats["rejected"] += 1
+            raise Overloaded(self.retry_after())
+        future = asyncio.get_running_loop().create_future()
+        self.stats["accepted"] += 1
+        await self.queue.put((payload, future))
+        return await future
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        # 타임아웃 등으로 이미 취소된 요청은 보내지 않습니다.
+        return [(p, f) for p, f in batch if not f.done()]
+
+    async def _dispatch_loop(self):
+        while True:
+            await self._slots.acquire()
+            batch = await self._collect()
+            if not batch:
+                self._slots.release()
+                continue
+            task = asyncio.create_task(self._run(batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    async def _run(self, batch):
+        self.in_flight += 1
+        started = time.monotonic()
+        try:
+            results = await self.run_batch([payload for payload, _ in batch])
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            elapsed = time.monotonic() - started
+            self.batch_latency = 0.8 * self.batch_latency + 0.2 * elapsed
+            self.stats["batches"] += 1
+            self.stats["batched_requests"] += len(batch)
+            self.in_flight -= 1
+            self._slots.release()
+
+
+async def handle_chat(request):
+    try:
+        body = await request.json()
+    except Exception:
+        return web.json_response({"error": "invalid JSON"}, status=400)
+    question = body.get("question") if isinstance(body, dict) else None
+    if not isinstance(question, str) or not question.strip():
+        return web.json_response({"error": "'question' is required"}, status=400)
+
+    payload = {"question": question.strip(), "chat_history": body.get("chat_history") or ""}
+    batcher = request.app["batcher"]
+    started = time.monotonic()
+    try:
+        result = await asyncio.wait_for(batcher.submit(payload), request.app["config"]["request_timeout"])
+    except Overloaded as e:
+        return web.json_response(
+            {"error": "server overloaded"},
+            status=503,
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except asyncio.TimeoutError:
+        return web.json_response({"error": "timeout"}, status=504)
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+
+    if "error" in result:
+        return web.json_response(result, status=500)
+    if result.get("retrieval_class"):
+        entry = request.app["retrieval_stats"].setdefault(
+            result["retrieval_class"], {"count": 0, "retrieval_ms": 0.0, "retrieval_count": 0, "seconds": 0.0}
+        )
+        entry["count"] += 1
+        entry["seconds"] += time.monotonic() - started
+        if result.get("retrieval_ms") is not None:
+            entry["retrieval_ms"] += result["retrieval_ms"]
+            entry["retrieval_count"] += 1
+    return web.json_response(result)
+
+
+async def handle_health(request):
+    batcher = request.app["batcher"]
+    return web.json_response({
+        "status": "ok",
+        "workers": request.app["config"]["workers"],
+        "pending": batcher.queue.qsize(),
+        "in_flight": batcher.in_flight,
+        "batch_latency": round(batcher.batch_latency, 3),
+        **batcher.stats,
+        # 검색 클래스(keyword/default/wide)별 요청 수, 평균 검색 시간(worker 안), 평균 전체 응답 시간
+        "retrieval": {
+            name: {
+                "count": entry["count"],
+                "retrieval_avg_ms": round(entry["retrieval_ms"] / entry["retrieval_count"], 1)
+                if entry["retrieval_count"] else None,
+                "total_avg_ms": round(entry["seconds"] / entry["count"] * 1000, 1)
+            }
+            for name, entry in request.app["retrieval_stats"].items()
+        }
+    })
+
+
+def create_app(config=None, run_batch=None):
+    """
+    HTTP 앱을 생성합니다.
+    run_batch를 넘기지 않으면 worker 프로세스 풀을 띄워 get_rag_chain과 같은 구성으로 답변합니다.
+    """
+    config = {**API_CONFIG, **(config or {})}
+    app = web.Application()
+    app["config"] = config
+    app["retrieval_stats"] = {}
+
+    async def on_startup(app):
+        runner = run_batch
+        if runner is None:
+            executor = ProcessPoolExecutor(
+                max_workers=config["workers"],
+                initializer=_init_worker,
+                initargs=(config["llm_concurrency"],)
+            )
+            app["executor"] = executor
+            loop = asyncio.get_running_loop()
+            # 모든 worker를 미리 띄워 인덱스 로딩(cold start)을 트래픽 전에 끝냅니다.
+            # 한 worker가 ping을 여러 개 받을 수 있으므로 서로 다른 pid가 모두 응답할 때까지 반복합니다.
+            pids = set()
+            while len(pids) < config["workers"]:
+                pids.update(await asyncio.gather(*[
+                    loop.run_in_executor(executor, _ping) for _ in range(config["workers"])
+                ]))
+                if len(pids) < config["workers"]:
+                    await asyncio.sleep(0.2)  # 아직 초기화 중인 worker
+
+            async def runner(requests):
+                return await loop.run_in_executor(executor, _run_batch, requests)
+
+        app["batcher"] = MicroBatcher(
+            runner,
+            max_batch_size=config["max_batch_size"],
+            max_wait_ms=config["max_wait_ms"],
+            max_pending=config["max_pending"],
+            max_in_flight=config["workers"] * config["batches_per_worker"]
+        )
+        app["batcher"].start()
+
+    async def on_cleanup(app):
+        await app["batcher"].stop()
+        if "executor" in app:
+            app["executor"].shutdown(cancel_futures=True)
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    app.router.add_post("/chat", handle_chat)
+    app.router.add_get("/health", handle_health)
+    return app
+
+
+if __name__ == "__main__":
+    # 로컬 테스트: GUIDEBOOK_FAKE_MODELS=1 python guidebook_api.py --workers 2
+    parser = argparse.ArgumentParser(description="AION2 가이드 RAG API 서버")
+    parser.add_argument("--host", default=API_CONFIG["host"])
+    parser.add_argument("--port", type=int, default=API_CONFIG["port"])
+    parser.add_argument("--workers", type=int, default=API_CONFIG["workers"])
+    parser.add_argument("--max-batch-size", type=int, default=API_CONFIG["max_batch_size"])
+    parser.add_argument("--max-wait-ms", type=int, default=API_CONFIG["max_wait_ms"])
+    parser.add_argument("--max-pending", type=int, default=API_CONFIG["max_pending"])
+    args = parser.parse_args()
+
+    app = create_app({
+        "workers": args.workers,
+        "max_batch_size": args.max_batch_size,
+        "max_wait_ms": args.max_wait_ms,
+        "max_pending": args.max_pending
+    })
+    web.run_app(app, host=args.host, port=args.port)
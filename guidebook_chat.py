@@ -1,5 +1,10 @@
 import streamlit as st
-from guidebook_rag import get_rag_chain # 분리한 파일 import
+from dotenv import load_dotenv
+from guidebook_rag import load_models, build_retrievers, get_answer_chain # 분리한 파일 import
+from index_generations import GenerationManager
+from remote_clients import get_remote_clients
+from adaptive_retrieval import entity_names
+from conversation_retrieval import ConversationRetrievalContext
 
 # 페이지 설정
 st.set_page_config(page_title="AION2 가이드 봇", page_icon="🛡️")
@@ -25,15 +30,45 @@ def format_chat_history(messages):
 st.title("🛡️ AION2 게임 가이드 (Context)")
 
 # 1. 체인 로딩 (캐싱)
+# 프로세스당 한 번만 만들고, 새 인덱스 세대(data/index_manifest.json)가 올라오면
+# 백그라운드에서 리트리버를 새로 만들어 요청 사이에 교체합니다. (재시작 불필요)
 @st.cache_resource
-def load_chain():
-    return get_rag_chain()
+def load_chain_manager():
+    load_dotenv()
+    embeddings, model = load_models()
+    answer_chain = get_answer_chain(model)
 
-chain = load_chain()
+    def build_generation(generation):
+        _, bm25_retriever, retriever = build_retrievers(embeddings, generation)
+        entities = set()
+        for doc in (bm25_retriever.docs if bm25_retriever else []):
+            entities |= entity_names(doc.metadata)
+        return {
+            "generation_id": generation["id"] if generation else None,
+            "retriever": retriever,            # 전체 Hybrid 검색
+            "bm25_retriever": bm25_retriever,  # 후속 질문 보충 검색 (샤드 모드에서는 None -> 재사용 안 함)
+            "entities": entities,              # 후속 질문 판단용 가이드/스킬 이름
+            "answer_chain": answer_chain
+        }
+
+    return GenerationManager(build_generation).start()
+
+chain_manager = load_chain_manager()
+
+# 원격 호출(OpenAI/Pinecone) 엔드포인트별 지연/재시도/hedge 통계
+with st.sidebar.expander("📡 원격 호출 통계"):
+    st.json(get_remote_clients().stats())
 
 # 2. 세션 초기화
 if "messages" not in st.session_state:
     st.session_state.messages = []
+if "retrieval_context" not in st.session_state:
+    # 이전 턴의 후보 청크를 들고 있다가 후속 질문에 재사용합니다.
+    st.session_state.retrieval_context = ConversationRetrievalContext()
+
+# 이 세션에서 전체 검색 / 후속 질문 재사용 횟수와 누적 시간
+with st.sidebar.expander("🔁 검색 재사용 통계"):
+    st.json(st.session_state.retrieval_context.stats)
 
 # 3. 대화 기록 표시
 for message in st.session_state.messages:
@@ -50,7 +85,7 @@ if query := st.chat_input("질문을 입력하세요..."):
     st.chat_message("user").write(query)
     st.session_state.messages.append({"role": "user", "content": query})
 
-    if chain:
+    if chain_manager:
         with st.chat_message("assistant"):
             container = st.empty()
             container.markdown("⏳ 생각 중...")
@@ -60,10 +95,22 @@ if query := st.chat_input("질문을 입력하세요..."):
             
             try:
                 # [핵심] 질문과 히스토리를 함께 전달
-                result = chain.invoke({
-                    "question": query,
-                    "chat_history": chat_history_str
-                })
+                # 한 질문은 처음 받은 세대의 리트리버로 끝까지 처리합니다. (코퍼스 버전이 섞이지 않음)
+                with chain_manager.acquire() as resources:
+                    retrieval_context = st.session_state.retrieval_context
+                    retrieval_context.sync_generation(resources["generation_id"])
+                    # 후속 질문("그럼 쿨타임은?")이면 이전 후보 재사용 + BM25 보충, 아니면 전체 검색
+                    docs = retrieval_context.retrieve(
+                        query,
+                        resources["retriever"],
+                        resources["bm25_retriever"],
+                        resources["entities"]
+                    )
+                    result = resources["answer_chain"].invoke({
+                        "context": docs,
+                        "question": query,
+                        "chat_history": chat_history_str
+                    })
                 
                 answer = result['answer']
                 sources = result['context']
@@ -73,6 +120,8 @@ if query := st.chat_input("질문을 입력하세요..."):
                 # 출처 UI 생성
                 source_data = []
                 with st.expander("📚 참고 문서 확인"):
+                    if sources and sources[0].metadata.get("retrieval_class"):
+                        st.caption(f"검색 방식: {sources[0].metadata['retrieval_class']}")
                     for doc in sources:
                         score = doc.metadata.get('relevance_score', 0)
                         title = doc.metadata.get('title', '제목 없음')
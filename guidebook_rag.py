@@ -1,5 +1,4 @@
 import os
-import json
 from operator import itemgetter
 from dotenv import load_dotenv
 
@@ -7,11 +6,11 @@ from dotenv import load_dotenv
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough, RunnableParallel
-from langchain_core.documents import Document
+from langchain_core.vectorstores import InMemoryVectorStore
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import FakeListChatModel
 
 # Models & Stores
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain_pinecone import PineconeVectorStore
 from langchain_cohere import CohereRerank
 
 # Retrievers
@@ -19,66 +18,165 @@ from langchain_classic.retrievers import ContextualCompressionRetriever, Ensembl
 from langchain_community.retrievers import BM25Retriever
 from DebugBM25Retriever import DebugBM25Retriever
 from DebugPineconeRetriever import DebugPineconeRetriever
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from chunk_store import load_chunks, build_metadata_index
+from embedding_compression import CompressedVectorIndex, CompressedVectorRetriever
+from adaptive_retrieval import AdaptiveRetriever
+from guide_shards import load_shard_manifest, build_shard_router, shard_namespace
+from remote_clients import get_remote_clients
 
 CONFIG = {
     "index_name": "aion2-guide-rag",
     "embedding_model": "text-embedding-3-large",
     "llm_model": "gpt-4o-mini",
     "rerank_model": "rerank-multilingual-v3.0",
-    "local_data_path": "data/guide_docs.json" # 크롤링한 데이터 경로
+    "chunk_store_path": "data/guide_chunks.jsonl", # ingest 단계에서 만든 청크 저장소
+    "embedding_dimensions": None, # None이면 모델 기본 차원(3072). 줄이면 Pinecone 인덱스도 같은 차원이어야 합니다.
+    "vector_backend": "pinecone", # "pinecone" | "compressed" (embedding_compression.py build 로 만든 로컬 압축 인덱스)
+    "compressed_index_dir": "data/compressed_index",
+    "adaptive_retrieval": True, # 질문마다 키워드 단독 / 기본 Hybrid / 넓은 검색+rerank 중 하나를 고릅니다.
+    "sharded": False, # True면 locale/카테고리별 샤드(guide_shards.py)로 라우팅. ingest도 샤드 namespace로 올려야 합니다.
+    "shards_dir": "data/shards",
+    "locales": ["ko-kr"] # 검색 대상 locale
 }
 
-def load_bm25_documents():
-    """로컬 JSON 파일을 읽어 BM25용 Document 리스트를 반환합니다."""
-    path = CONFIG["local_data_path"]
+def load_bm25_documents(path=None):
+    """ingest 단계에서 저장한 청크 저장소를 읽어 BM25용 Document 리스트를 반환합니다."""
+    path = path or CONFIG["chunk_store_path"]
     
     if not os.path.exists(path):
-        print(f"⚠️ 경고: '{path}' 파일이 없습니다. BM25 검색을 건너뜁니다.")
+        print(f"⚠️ 경고: '{path}' 파일이 없습니다. BM25 검색을 건너뜁니다. (python chunk_store.py 로 생성)")
         return []
 
     print(f"📂 BM25 인덱싱을 위해 '{path}' 로딩 중...")
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            
-        # JSON -> Document 객체 변환
-        docs = [Document(page_content=d["page_content"], metadata=d["metadata"]) for d in data]
+        # 청크 저장소는 이미 분할된 상태이므로 다시 나누지 않습니다.
+        chunks = load_chunks(path)
         
-        # BM25도 청크 단위로 검색해야 정확하므로 분할 수행
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        split_docs = text_splitter.split_documents(docs)
-        
-        print(f"✅ BM25 인덱스 생성 완료 (총 {len(split_docs)}개 청크)")
-        return split_docs
+        print(f"✅ BM25 인덱스 생성 완료 (총 {len(chunks)}개 청크)")
+        return chunks
         
     except Exception as e:
         print(f"❌ BM25 데이터 로딩 실패: {e}")
         return []
 
-def get_rag_chain():
-    """
-    Hybrid Search (Pinecone + BM25) -> Rerank -> LLM 체인 생성
+# 프롬프트 템플릿
+PROMPT_TEMPLATE = """
+    당신은 AION2 게임 가이드 AI입니다.
+    아래의 [이전 대화 내용]과 [참고 문서]를 바탕으로 질문에 답변해주세요.
+    
+    1. 문서에 없는 내용은 지어내지 말고 모른다고 하세요.
+    2. 이전 대화의 맥락을 고려하여 답변하세요.
+    3. 아이템, 스킬 명칭은 문서에 있는 그대로 정확히 사용하세요.
+    4. 사용자가 특정 직업(예: 수호성, 호법성 등)에 대해 물었다면, 반드시 해당 직업의 문서만 참조하세요.
+    5. 문서의 [metadata]나 제목을 확인하여 질문한 직업과 일치하는지 확인하세요.
+    
+    [이전 대화 내용]
+    {chat_history}
+
+    [참고 문서]
+    {context}
+
+    질문: {question}
     """
-    load_dotenv()
 
-    # 1. Pinecone Retriever 설정 (Vector Search)
-    embeddings = OpenAIEmbeddings(model=CONFIG["embedding_model"])
-    vector_store = PineconeVectorStore.from_existing_index(
-        index_name=CONFIG["index_name"],
-        embedding=embeddings
-    )
-    # Reranker에게 보낼 후보군 (Vector)
-    # pinecone_retriever = vector_store.as_retriever(search_kwargs={"k": 5})
-    pinecone_retriever = DebugPineconeRetriever(
-        vectorstore=vector_store, 
-        search_kwargs={"k": 5}
+def use_fake_models():
+    """GUIDEBOOK_FAKE_MODELS=1 이면 외부 API 없이 로컬 가짜 모델로 동작합니다. (로컬 테스트용)"""
+    return os.getenv("GUIDEBOOK_FAKE_MODELS") == "1"
+
+def load_models():
+    """임베딩 모델과 LLM을 생성합니다."""
+    if use_fake_models():
+        return (
+            DeterministicFakeEmbedding(size=256),
+            FakeListChatModel(responses=["(fake) 참고 문서를 바탕으로 한 테스트 답변입니다."])
+        )
+    # 연결 풀 / 동시 실행 제한 / 재시도 / hedging은 프로세스 공용 RemoteClients가 담당합니다.
+    clients = get_remote_clients()
+    embeddings = clients.embeddings(CONFIG["embedding_model"], dimensions=CONFIG["embedding_dimensions"])
+    model = clients.chat_model(CONFIG["llm_model"], temperature=0)
+    return embeddings, model
+
+def build_vector_store(embeddings, chunks=None, namespace=None):
+    """Pinecone 인덱스에 연결합니다. 가짜 모델 모드에서는 청크 저장소로 메모리 인덱스를 만듭니다."""
+    if use_fake_models():
+        return InMemoryVectorStore.from_documents(chunks or [], embeddings)
+    # 세대/샤드별 vector store는 같은 Pinecone 연결 풀을 공유합니다.
+    return get_remote_clients().vector_store(CONFIG["index_name"], embeddings, namespace)
+
+def build_reranker():
+    """애매한 질문(wide)에서 넓힌 후보를 재정렬할 Cohere Rerank. 키가 없으면 None"""
+    if use_fake_models() or not os.getenv("COHERE_API_KEY"):
+        return None
+    return CohereRerank(
+        model=CONFIG["rerank_model"],
+        cohere_api_key=os.getenv("COHERE_API_KEY"),
+        top_n=5
     )
-    
-    # 2. BM25 Retriever 설정 (Keyword Search) [추가됨]
-    bm25_docs = load_bm25_documents()
+
+def build_retrievers(embeddings, generation=None):
+    """
+    Hybrid Search (Pinecone + BM25) 리트리버를 생성합니다.
+    generation: index_generations의 세대 정보. 주면 그 세대의 청크 저장소/namespace만 사용합니다.
+    반환값: (vector 리트리버, BM25 리트리버 또는 None, 최종 리트리버)
+            샤드 모드에서는 (None, None, ShardRouter)
+    """
+    generation = generation or {}
+    compressed_index_dir = generation.get("compressed_index_dir") or CONFIG["compressed_index_dir"]
+    if generation:
+        print(f"🗂️ 인덱스 세대: {generation['id']}")
+        if CONFIG["vector_backend"] == "compressed" and not generation.get("compressed_index_dir"):
+            # 전역 압축 인덱스는 이 세대의 청크 ID와 맞지 않을 수 있습니다.
+            raise ValueError(f"인덱스 세대 '{generation['id']}'에 압축 인덱스가 없습니다. (--compressed-index로 publish)")
+
+    if CONFIG["sharded"]:
+        shards_dir = generation.get("shards_dir") or CONFIG["shards_dir"]
+        shards_info = load_shard_manifest(shards_dir)
+        if not shards_info:
+            print(f"⚠️ 샤드 목록이 없습니다: '{shards_dir}' (python guide_shards.py 로 생성) -> 단일 인덱스로 동작합니다.")
+        elif CONFIG["vector_backend"] == "compressed":
+            print("⚠️ 압축 벡터 인덱스는 샤드를 지원하지 않습니다 -> 단일 인덱스로 동작합니다.")
+        else:
+            # 샤드마다 자기 청크/namespace만 가진 Hybrid 리트리버를 두고, 질문은 관련 샤드로만 보냅니다.
+            print(f"🧩 샤드 라우팅 모드: {len(shards_info)}개 샤드 ({', '.join(CONFIG['locales'])})")
+            router = build_shard_router(
+                shards_info,
+                lambda key, docs: build_hybrid_retriever(
+                    embeddings, docs, namespace=shard_namespace(key, generation.get("namespace"))
+                )[2],
+                locales=CONFIG["locales"]
+            )
+            return None, None, router
+
+    # 1. BM25용 청크 로딩 (Keyword Search) [추가됨]
+    bm25_docs = load_bm25_documents(generation.get("chunks_path"))
+    return build_hybrid_retriever(embeddings, bm25_docs, generation.get("namespace"), compressed_index_dir)
+
+def build_hybrid_retriever(embeddings, bm25_docs, namespace=None, compressed_index_dir=None):
+    """청크 목록 하나(전체 코퍼스 또는 샤드 하나)로 Vector + BM25 Hybrid 리트리버를 만듭니다."""
+    compressed_index_dir = compressed_index_dir or CONFIG["compressed_index_dir"]
+
+    # 2. Pinecone Retriever 설정 (Vector Search)
+    if CONFIG["vector_backend"] == "compressed":
+        # 축소 차원 + 양자화 인덱스로 1차 검색 후 원본 벡터로 재정렬
+        print(f"🗜️ 압축 벡터 인덱스 사용: '{compressed_index_dir}'")
+        pinecone_retriever = CompressedVectorRetriever(
+            index=CompressedVectorIndex.load(compressed_index_dir),
+            embeddings=embeddings,
+            docs_by_id={doc.id: doc for doc in bm25_docs},
+            k=5
+        )
+    else:
+        vector_store = build_vector_store(embeddings, bm25_docs, namespace)
+        # Reranker에게 보낼 후보군 (Vector)
+        # pinecone_retriever = vector_store.as_retriever(search_kwargs={"k": 5})
+        pinecone_retriever = DebugPineconeRetriever(
+            vectorstore=vector_store, 
+            search_kwargs={"k": 5},
+            metadata_index=build_metadata_index(bm25_docs)
+        )
 
     base_retriever = pinecone_retriever # 기본값은 Pinecone 단독
+    bm25_retriever = None
     
     if bm25_docs:
         bm25_retriever = DebugBM25Retriever.from_documents(bm25_docs)
@@ -86,11 +184,18 @@ def get_rag_chain():
 
         # 3. Ensemble (Hybrid) 설정 [추가됨]
         # weights=[0.5, 0.5]: 벡터와 키워드 검색 결과를 반반씩 반영
+        # id_key: 두 검색 결과를 같은 chunk_id 기준으로 합칩니다.
         print("🔗 Hybrid Search(Pinecone + BM25) 모드로 동작합니다.")
         base_retriever = EnsembleRetriever(
             retrievers=[pinecone_retriever, bm25_retriever],
-            weights=[0.5, 0.5]
+            weights=[0.5, 0.5],
+            id_key="chunk_id"
         )
+        if CONFIG["adaptive_retrieval"]:
+            # 값싼 신호로 검색 깊이를 정하고, 확실한 키워드 질문은 벡터 검색을 건너뜁니다.
+            base_retriever = AdaptiveRetriever.from_retrievers(
+                pinecone_retriever, bm25_retriever, base_retriever, reranker=build_reranker()
+            )
     else:
         print("⚠️ Hybrid Search 실패 -> Pinecone 단독 모드로 동작합니다.")
 
@@ -107,45 +212,46 @@ def get_rag_chain():
     #     base_retriever=base_retriever
     # )
 
-    # 5. 프롬프트 템플릿
-    template = """
-    당신은 AION2 게임 가이드 AI입니다.
-    아래의 [이전 대화 내용]과 [참고 문서]를 바탕으로 질문에 답변해주세요.
-    
-    1. 문서에 없는 내용은 지어내지 말고 모른다고 하세요.
-    2. 이전 대화의 맥락을 고려하여 답변하세요.
-    3. 아이템, 스킬 명칭은 문서에 있는 그대로 정확히 사용하세요.
-    4. 사용자가 특정 직업(예: 수호성, 호법성 등)에 대해 물었다면, 반드시 해당 직업의 문서만 참조하세요.
-    5. 문서의 [metadata]나 제목을 확인하여 질문한 직업과 일치하는지 확인하세요.
-    
-    [이전 대화 내용]
-    {chat_history}
+    return pinecone_retriever, bm25_retriever, base_retriever
 
-    [참고 문서]
-    {context}
+# 문서 포맷팅 헬퍼
+def format_docs(docs):
+    return "\n\n".join(doc.page_content for doc in docs)
 
-    질문: {question}
+def get_answer_chain(model):
     """
-    prompt = ChatPromptTemplate.from_template(template)
-    model = ChatOpenAI(model=CONFIG["llm_model"], temperature=0)
+    이미 검색된 문서(context)로 답변만 생성하는 체인.
+    입력: {"context": [Document], "question": str, "chat_history": str}
+    """
+    prompt = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
+    return RunnablePassthrough.assign(answer=(
+        RunnablePassthrough.assign(context=lambda x: format_docs(x["context"]))
+        | prompt 
+        | model 
+        | StrOutputParser()
+    ))
+
+def get_rag_chain(generation=None):
+    """
+    Hybrid Search (Pinecone + BM25) -> Rerank -> LLM 체인 생성
+    """
+    load_dotenv()
+
+    embeddings, model = load_models()
+    return build_rag_chain(embeddings, model, generation)
 
-    # 6. 문서 포맷팅 헬퍼
-    def format_docs(docs):
-        return "\n\n".join(doc.page_content for doc in docs)
+def build_rag_chain(embeddings, model, generation=None):
+    """이미 만든 모델로 한 인덱스 세대의 RAG 체인을 조립합니다. (세대 교체 시 모델은 재사용)"""
+    _, _, base_retriever = build_retrievers(embeddings, generation)
 
-    # 7. Chain 조립
+    # Chain 조립
     rag_chain = (
         RunnableParallel({
             "context": itemgetter("question") | base_retriever, 
             "question": itemgetter("question"),
             "chat_history": itemgetter("chat_history") 
         })
-        .assign(answer=(
-            RunnablePassthrough.assign(context=lambda x: format_docs(x["context"]))
-            | prompt 
-            | model 
-            | StrOutputParser()
-        ))
+        | get_answer_chain(model)
     )
     
     return rag_chain
@@ -0,0 +1,238 @@
+import os
+import gc
+import json
+import time
+import shutil
+import hashlib
+import threading
+from contextlib import contextmanager
+
+from chunk_store import DATA_DIR, CHUNK_STORE_PATH, iter_chunks
+from guide_shards import write_shards
+
+GENERATIONS_DIR = os.path.join(DATA_DIR, "generations")
+MANIFEST_PATH = os.path.join(DATA_DIR, "index_manifest.json")
+CHUNKS_FILE = "guide_chunks.jsonl"
+COMPRESSED_DIR = "compressed_index"
+SHARDS_DIR = "shards"
+POLL_SECONDS = 10
+KEEP_GENERATIONS = 3
+
+
+def new_generation_id(chunks_path=None):
+    """시각 + (있으면) 청크 저장소 해시로 세대 ID를 만듭니다."""
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    if chunks_path and os.path.exists(chunks_path):
+        digest = hashlib.sha1()
+        with open(chunks_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return f"{stamp}-{digest.hexdigest()[:8]}"
+    return stamp
+
+
+def read_manifest(path=MANIFEST_PATH):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def current_generation(path=MANIFEST_PATH):
+    """
+    현재 세대 정보 dict를 반환합니다. manifest가 없으면 None (기존 단일 경로 모드)
+    {"id", "chunks_path", "compressed_index_dir", "shards_dir", "namespace", "created_at"}
+    """
+    manifest = read_manifest(path)
+    if not manifest or not manifest.get("current"):
+        return None
+    for generation in manifest.get("generations", []):
+        if generation["id"] == manifest["current"]:
+            return generation
+    return None
+
+
+def check_compressed_index(compressed_index_dir, chunks_path):
+    """압축 인덱스가 청크 저장소와 같은 청크로 만들어졌는지 확인합니다. (다르면 벡터 검색 결과가 빠집니다)"""
+    meta_path = os.path.join(compressed_index_dir, "meta.json")
+    if not os.path.exists(meta_path):
+        raise ValueError(f"compressed index not found: {compressed_index_dir}")
+    with open(meta_path, "r", encoding="utf-8") as f:
+        index_ids = set(json.load(f)["ids"])
+    chunk_ids = {chunk.id for chunk in iter_chunks(chunks_path)}
+    if index_ids != chunk_ids:
+        raise ValueError(f"compressed index '{compressed_index_dir}' does not match '{chunks_path}' "
+                         f"({len(chunk_ids - index_ids)} chunks missing, {len(index_ids - chunk_ids)} unknown)")
+
+
+def publish_generation(generation_id=None, chunks_path=CHUNK_STORE_PATH, compressed_index_dir=None,
+                       namespace=None, manifest_path=MANIFEST_PATH, generations_dir=GENERATIONS_DIR,
+                       keep=KEEP_GENERATIONS):
+    """
+    청크 저장소(와 압축 인덱스)를 새 세대 디렉터리로 복사한 뒤 manifest를 원자적으로 교체합니다.
+    압축 인덱스가 청크 저장소와 맞지 않으면 ValueError (publish 하지 않음)
+    namespace: 이 세대의 벡터가 올라간 Pinecone namespace (None이면 기본 namespace)
+    """
+    if compressed_index_dir:
+        check_compressed_index(compressed_index_dir, chunks_path)
+    generation_id = generation_id or new_generation_id(chunks_path)
+    final_dir = os.path.join(generations_dir, generation_id)
+    tmp_dir = final_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    shutil.copy2(chunks_path, os.path.join(tmp_dir, CHUNKS_FILE))
+    # locale/카테고리별 샤드 저장소도 같은 세대에 함께 묶습니다. (CONFIG["sharded"]일 때 사용)
+    write_shards(os.path.join(tmp_dir, CHUNKS_FILE), os.path.join(tmp_dir, SHARDS_DIR))
+    if compressed_index_dir:
+        shutil.copytree(compressed_index_dir, os.path.join(tmp_dir, COMPRESSED_DIR))
+    os.replace(tmp_dir, final_dir)
+
+    manifest = read_manifest(manifest_path) or {"generations": []}
+    generation = {
+        "id": generation_id,
+        "chunks_path": os.path.join(final_dir, CHUNKS_FILE),
+        "compressed_index_dir": os.path.join(final_dir, COMPRESSED_DIR) if compressed_index_dir else None,
+        "shards_dir": os.path.join(final_dir, SHARDS_DIR),
+        "namespace": namespace,
+        "created_at": time.time()
+    }
+    manifest["generations"] = [g for g in manifest["generations"] if g["id"] != generation_id] + [generation]
+    manifest["current"] = generation_id
+
+    # 실행 중인 worker가 지난 세대를 아직 쓰고 있을 수 있으므로 최근 keep개는 남겨둡니다.
+    retired = manifest["generations"][:-keep] if keep else []
+    manifest["generations"] = manifest["generations"][len(retired):]
+
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_path, manifest_path)
+
+    for old in retired:
+        shutil.rmtree(os.path.join(generations_dir, old["id"]), ignore_errors=True)
+    print(f"   [+] Published index generation '{generation_id}'")
+    return generation, retired
+
+
+class _LoadedGeneration:
+    def __init__(self, generation, resource):
+        self.generation = generation
+        self.resource = resource
+        self.in_flight = 0
+        self.retired = False
+
+
+class GenerationManager:
+    """
+    세대별로 만든 리소스(체인/리트리버)를 들고 있다가, manifest가 바뀌면 백그라운드에서
+    새 세대를 만들어 요청 사이에 원자적으로 교체합니다.
+    - 요청은 acquire()로 받은 한 세대의 리소스만 끝까지 사용합니다. (두 코퍼스가 섞이지 않음)
+    - 교체된 이전 세대는 진행 중인 요청이 모두 끝나면 참조를 놓아 메모리를 반환합니다.
+    """
+
+    def __init__(self, build_fn, manifest_path=MANIFEST_PATH, poll_seconds=POLL_SECONDS):
+        self.build_fn = build_fn
+        self.manifest_path = manifest_path
+        self.poll_seconds = poll_seconds
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._manifest_mtime = self._mtime()
+        generation = current_generation(manifest_path)
+        self._active = _LoadedGeneration(generation, build_fn(generation))
+        self._retired = []
+        self._watcher = None
+
+    def _mtime(self):
+        try:
+            return os.stat(self.manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    @property
+    def generation_id(self):
+        generation = self._active.generation
+        return generation["id"] if generation else None
+
+    def start(self):
+        """manifest 감시 스레드를 시작합니다."""
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch, daemon=True)
+            self._watcher.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                self.check_for_update()
+            except Exception as e:
+                # 새 세대 로딩에 실패해도 현재 세대로 계속 서비스합니다.
+                print(f"⚠️ 새 인덱스 세대 로딩 실패: {e}")
+
+    def check_for_update(self):
+        """manifest가 바뀌었으면 새 세대를 만들어 교체합니다. 교체했으면 True"""
+        mtime = self._mtime()
+        if mtime == self._manifest_mtime:
+            return False
+        generation = current_generation(self.manifest_path)
+        new_id = generation["id"] if generation else None
+        if new_id == self.generation_id:
+            self._manifest_mtime = mtime
+            return False
+
+        print(f"🔄 새 인덱스 세대 로딩 중: {new_id}")
+        # 락 밖에서 생성 (서비스 중단 없음). 실패하면 mtime을 그대로 두어 다음 확인 때 다시 시도합니다.
+        loaded = _LoadedGeneration(generation, self.build_fn(generation))
+        with self._lock:
+            old, self._active = self._active, loaded
+            old.retired = True
+            self._retired.append(old)
+            self._release_drained()
+        self._manifest_mtime = mtime
+        print(f"✅ 인덱스 세대 교체 완료: {new_id}")
+        return True
+
+    def _release_drained(self):
+        drained = [g for g in self._retired if g.in_flight == 0]
+        if not drained:
+            return
+        self._retired = [g for g in self._retired if g.in_flight > 0]
+        for g in drained:
+            g.resource = None
+        gc.collect()
+
+    @contextmanager
+    def acquire(self):
+        """현재 세대의 리소스를 요청 하나 동안 고정해서 빌려줍니다."""
+        with self._lock:
+            loaded = self._active
+            loaded.in_flight += 1
+        try:
+            yield loaded.resource
+        finally:
+            with self._lock:
+                loaded.in_flight -= 1
+                if loaded.retired:
+                    self._release_drained()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    # 예) ingest 없이 청크 저장소만 다시 만든 경우: python index_generations.py publish --namespace <기존 namespace>
+    parser = argparse.ArgumentParser(description="인덱스 세대 publish / 목록")
+    parser.add_argument("command", choices=["publish", "list"])
+    parser.add_argument("--chunks", default=CHUNK_STORE_PATH)
+    parser.add_argument("--compressed-index", help="함께 묶을 압축 인덱스 디렉터리 (embedding_compression.py build 결과)")
+    parser.add_argument("--namespace", help="이 세대의 벡터가 있는 Pinecone namespace")
+    args = parser.parse_args()
+
+    if args.command == "publish":
+        publish_generation(chunks_path=args.chunks, compressed_index_dir=args.compressed_index, namespace=args.namespace)
+    else:
+        manifest = read_manifest() or {"generations": []}
+        for generation in manifest["generations"]:
+            mark = "*" if generation["id"] == manifest.get("current") else " "
+            print(f"{mark} {generation['id']}  namespace={generation.get('namespace')}  {generation['chunks_path']}")
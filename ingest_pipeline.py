@@ -0,0 +1,401 @@
+import os
+import json
+import queue
+import threading
+from langchain_core.documents import Document
+
+from guide_parser import parse_guide_page
+from chunk_store import DATA_DIR, DOCS_JSONL_PATH, CHUNK_STORE_PATH, chunk_documents, chunk_to_line, iter_chunks
+from near_dedup import NearDuplicateIndex, dedup_group, merge_duplicate, apply_duplicate_headers
+from guide_shards import annotate_shard, shard_key, shard_namespace
+from embedding_compression import VECTORS_PATH, append_vectors, reset_vectors
+
+ALIAS_FILE = os.path.join(DATA_DIR, "guide_chunk_aliases.jsonl")
+CHECKPOINT_FILE = os.path.join(DATA_DIR, "ingest_checkpoint.json")
+QUEUE_SIZE = 8          # 단계 사이 버퍼 크기 (메모리 상한)
+EMBED_BATCH_SIZE = 64   # 임베딩 API 한 번에 보내는 청크 수
+EMBED_FLUSH_SECONDS = 2 # 배치가 덜 찼어도 이 시간 동안 입력이 없으면 보냅니다.
+FETCH_WORKERS = 1
+STAGING_SUFFIX = ".staging"  # 실행 중인 결과 파일. 다 끝나면 promote_staged로 원래 경로에 바꿔 넣습니다.
+_DONE = object()
+
+
+def staging_path(path):
+    return path + STAGING_SUFFIX
+
+
+def promote_staged(docs_path=DOCS_JSONL_PATH, chunks_path=CHUNK_STORE_PATH, vectors_path=VECTORS_PATH):
+    """
+    스테이징 파일을 원래 경로로 os.replace 합니다. (파일마다 원자적으로 교체)
+    서버나 다른 도구는 교체 전까지 이전 청크 저장소/벡터를 그대로 읽습니다.
+    스테이징 파일이 없으면 (이미 옮겼으면) 그 경로는 건드리지 않습니다.
+    """
+    pairs = [(vectors_path + ".ids", staging_path(vectors_path) + ".ids"),
+             (vectors_path, staging_path(vectors_path)),
+             (docs_path, staging_path(docs_path)),
+             (chunks_path, staging_path(chunks_path))]
+    for path, staged in pairs:
+        if os.path.exists(staged):
+            os.replace(staged, path)
+
+
+class IngestCheckpoint:
+    """
+    업로드까지 끝난 URL 목록. 중단 후 다시 실행하면 이 URL들은 건너뜁니다.
+    generation: 이번 ingest가 벡터를 올리고 있는 인덱스 세대 ID (이어서 실행해도 같은 namespace 사용)
+    skipped: 다시 해도 결과가 같은 URL(문서 없음, 파싱 실패) -> 이유. completed에도 들어갑니다.
+    runs: 이 세대로 실행한 횟수. 계속 실패하는 URL 때문에 세대 공개가 끝없이 밀리지 않도록 씁니다.
+    """
+
+    def __init__(self, path=CHECKPOINT_FILE):
+        self.path = path
+        self.completed = set()
+        self.skipped = {}
+        self.generation = None
+        self.runs = 0
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.completed = set(data.get("completed", []))
+            self.skipped = data.get("skipped", {})
+            self.generation = data.get("generation")
+            self.runs = data.get("runs", 0)
+
+    def mark(self, urls, skipped=None):
+        self.completed.update(urls)
+        self.skipped.update(skipped or {})
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"completed": sorted(self.completed), "skipped": self.skipped,
+                       "generation": self.generation, "runs": self.runs}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def reset(self):
+        self.completed = set()
+        self.skipped = {}
+        self.generation = None
+        self.runs = 0
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class WorkUnit:
+    """
+    URL 하나에서 나온 문서/청크/중복 별칭 묶음. 업로드가 끝나면 버려집니다.
+    skip_reason: 문서가 없거나 파싱에 실패한 URL. 빈 묶음으로 업로드 단계까지 흘려 체크포인트에 남깁니다.
+    """
+
+    def __init__(self, url, docs, skip_reason=None):
+        self.url = url
+        self.docs = docs
+        self.skip_reason = skip_reason
+        self.chunks = []
+        self.aliases = []
+
+
+def vector_namespace(vector_store, chunk, sharded):
+    """청크가 올라갈 Pinecone namespace. 샤드 모드면 세대 namespace 아래 locale/카테고리별로 나눕니다."""
+    base = getattr(vector_store, "_namespace", None)
+    return shard_namespace(shard_key(chunk.metadata), base) if sharded else base
+
+
+def upsert_vectors(vector_store, chunks, vectors, sharded=False):
+    """미리 계산한 임베딩으로 벡터를 업로드합니다."""
+    if hasattr(vector_store, "index") and hasattr(vector_store.index, "upsert"):
+        text_key = getattr(vector_store, "_text_key", "text")
+        by_namespace = {}
+        for chunk, vector in zip(chunks, vectors):
+            by_namespace.setdefault(vector_namespace(vector_store, chunk, sharded), []).append(
+                (chunk.id, vector, {**chunk.metadata, text_key: chunk.page_content})
+            )
+        for namespace, batch in by_namespace.items():
+            vector_store.index.upsert(vectors=batch, namespace=namespace)
+    else:
+        # 로컬 테스트용 벡터 스토어(InMemoryVectorStore 등)는 문서를 그대로 추가합니다.
+        vector_store.add_documents(chunks, ids=[chunk.id for chunk in chunks])
+
+
+def _run_stage(name, fn, inbox, outbox):
+    """inbox에서 하나씩 꺼내 fn을 적용하고 결과를 outbox로 넘기는 단계 스레드"""
+    while True:
+        item = inbox.get()
+        if item is _DONE:
+            outbox.put(_DONE)
+            return
+        try:
+            result = fn(item)
+        except Exception as e:
+            print(f"      [!] {name} error: {e}")
+            continue
+        if result is not None:
+            outbox.put(result)
+
+
+def _run_fetchers(fetcher, urls, outbox, workers):
+    """URL을 여러 스레드로 가져옵니다. 마지막 스레드가 끝나면 _DONE을 넘깁니다."""
+    url_queue = queue.Queue()
+    for url in urls:
+        url_queue.put(url)
+    remaining = [workers]
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            try:
+                url = url_queue.get_nowait()
+            except queue.Empty:
+                break
+            print(f"   -> Accessing: {url}")
+            try:
+                outbox.put((url, fetcher.fetch(url, wait_class="ncgbt-article")))
+            except Exception as e:
+                print(f"      [!] Fetch error: {e}")
+        with lock:
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                outbox.put(_DONE)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(workers)]
+    for t in threads:
+        t.start()
+    return threads
+
+
+def _run_embedder(embeddings, inbox, outbox, batch_size):
+    """청크 수가 batch_size가 될 때까지 WorkUnit을 모아 한 번에 임베딩합니다."""
+    pending = []
+
+    def flush():
+        texts = [chunk.page_content for unit in pending for chunk in unit.chunks]
+        try:
+            vectors = embeddings.embed_documents(texts) if texts else []
+        except Exception as e:
+            # 이 배치의 URL은 체크포인트에 남지 않으므로 다음 실행에서 다시 처리됩니다.
+            # 업로드 단계가 이 청크들을 중복 대표에서 뺄 수 있도록 벡터 없이 넘깁니다.
+            print(f"      [!] Embedding error: {e}")
+            vectors = None
+        outbox.put((list(pending), vectors))
+        pending.clear()
+
+    while True:
+        try:
+            item = inbox.get(timeout=EMBED_FLUSH_SECONDS if pending else None)
+        except queue.Empty:
+            flush()
+            continue
+        if item is _DONE:
+            if pending:
+                flush()
+            outbox.put(_DONE)
+            return
+        pending.append(item)
+        if sum(len(unit.chunks) for unit in pending) >= batch_size:
+            flush()
+
+
+def apply_aliases(chunks_path=CHUNK_STORE_PATH, alias_path=ALIAS_FILE, vector_store=None, sharded=False):
+    """
+    스트리밍 중에 기록한 중복 별칭을 대표 청크에 합칩니다.
+    청크 저장소를 한 줄씩 다시 쓰므로 메모리는 별칭 수에만 비례합니다.
+    """
+    if not os.path.exists(alias_path) or os.path.getsize(alias_path) == 0:
+        return 0
+    aliases = {}
+    with open(alias_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                alias = json.loads(line)
+                aliases.setdefault(alias["canonical_id"], []).append(alias)
+
+    updated = []
+    tmp_path = chunks_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as out:
+        for chunk in iter_chunks(chunks_path):
+            for alias in aliases.get(chunk.id, []):
+                merge_duplicate(chunk, Document(page_content=alias["header"], metadata=alias["metadata"]))
+            if chunk.id in aliases:
+                apply_duplicate_headers(chunk)
+                updated.append(chunk)
+            out.write(chunk_to_line(chunk))
+    os.replace(tmp_path, chunks_path)
+
+    if vector_store is not None and hasattr(vector_store, "index") and updated:
+        text_key = getattr(vector_store, "_text_key", "text")
+        for chunk in updated:
+            vector_store.index.update(
+                id=chunk.id,
+                set_metadata={**chunk.metadata, text_key: chunk.page_content},
+                namespace=vector_namespace(vector_store, chunk, sharded)
+            )
+    open(alias_path, "w").close()
+    return len(updated)
+
+
+def run_ingest_pipeline(urls, fetcher, embeddings, vector_store, resume=True, dedupe=True,
+                        batch_size=EMBED_BATCH_SIZE, fetch_workers=FETCH_WORKERS,
+                        docs_path=DOCS_JSONL_PATH, chunks_path=CHUNK_STORE_PATH,
+                        alias_path=ALIAS_FILE, checkpoint_path=CHECKPOINT_FILE, generation=None,
+                        url_categories=None, sharded=False, vectors_path=VECTORS_PATH):
+    """
+    fetch -> parse -> chunk -> embed -> upsert 를 bounded queue로 연결해 동시에 실행합니다.
+    - 페이지를 가져오는 동안 앞선 페이지의 임베딩/업로드가 진행됩니다.
+    - 문서/청크는 업로드가 끝난 URL 단위로 스테이징 JSONL(경로 + ".staging")에 바로 append 됩니다.
+      원래 경로의 파일은 promote_staged를 부를 때까지 바뀌지 않습니다.
+    - 체크포인트에 기록된 URL은 재실행 시 건너뜁니다. (resume=False면 처음부터)
+    - generation: vector_store가 가리키는 인덱스 세대 ID. 체크포인트에 남겨 이어서 실행할 때 재사용합니다.
+    - url_categories: URL -> 카테고리 ID (URL 프런티어). 문서에 locale/category_id를 붙이는 데 사용합니다.
+    - sharded: True면 벡터를 locale/카테고리별 namespace로 나눠 올립니다.
+    - 업로드한 임베딩은 vectors_path(의 스테이징 파일)에도 남겨 압축 인덱스를 다시 임베딩하지 않고 만듭니다.
+    """
+    os.makedirs(DATA_DIR, exist_ok=True)
+    docs_path, chunks_path, vectors_path = staging_path(docs_path), staging_path(chunks_path), staging_path(vectors_path)
+    checkpoint = IngestCheckpoint(checkpoint_path)
+    if (not resume or not checkpoint.completed or checkpoint.generation != generation
+            or not os.path.exists(chunks_path)):
+        # 이어서 할 체크포인트(와 스테이징 파일)가 없으면 스테이징 파일을 비우고 처음부터 씁니다.
+        checkpoint.reset()
+        for path in (docs_path, chunks_path, alias_path):
+            open(path, "w").close()
+        reset_vectors(vectors_path)
+    checkpoint.generation = generation
+    checkpoint.runs += 1
+    checkpoint.mark(())
+
+    pending_urls = [url for url in urls if url not in checkpoint.completed]
+    print(f"\n1. Streaming ingest: {len(pending_urls)} URLs ({len(urls) - len(pending_urls)} already done)")
+    if not pending_urls:
+        return
+
+    dup_index = NearDuplicateIndex() if dedupe else None
+    dup_lock = threading.Lock()  # chunk 단계(등록)와 업로드 단계(실패 시 제거)가 함께 씁니다.
+    unstored = set()             # 이번 실행에서 저장하지 못한 청크 ID
+    if dup_index is not None and os.path.exists(chunks_path):
+        # 이어서 실행할 때는 이미 저장된 청크로 중복 인덱스를 다시 채웁니다.
+        for chunk in iter_chunks(chunks_path):
+            dup_index.insert(chunk.id, dup_index.signature(chunk.page_content), dedup_group(chunk.metadata))
+
+    def forget(unit):
+        """
+        저장하지 못한 URL의 청크를 중복 대표에서 뺍니다.
+        이 청크를 대표로 가리키는 별칭이 있는 URL도 저장하지 않고 다음 실행에서 다시 처리합니다.
+        """
+        unstored.update(c.id for c in unit.chunks)
+        if dup_index is not None:
+            with dup_lock:
+                for c in unit.chunks:
+                    dup_index.remove(c.id)
+
+    def parse(item):
+        # 같은 HTML이면 다시 해도 결과가 같으므로, 실패해도 버리지 않고 건너뛴 URL로 남깁니다.
+        url, html = item
+        try:
+            docs = parse_guide_page(html, url)
+        except Exception as e:
+            print(f"      [!] Parse error: {e}")
+            return WorkUnit(url, [], skip_reason=f"parse error: {e}")
+        if not docs:
+            return WorkUnit(url, [], skip_reason="no documents")
+        for doc in docs:
+            annotate_shard(doc.metadata, url_categories or {})
+        return WorkUnit(url, docs)
+
+    def chunk(unit):
+        for c in chunk_documents(unit.docs):
+            canonical_id = None
+            if dup_index is not None:
+                with dup_lock:
+                    canonical_id = dup_index.add(c.id, c.page_content, dedup_group(c.metadata))
+            if canonical_id == c.id:
+                continue  # 이전 실행에서 이미 저장된 청크
+            if canonical_id is None:
+                unit.chunks.append(c)
+            else:
+                unit.aliases.append({
+                    "chunk_id": c.id,
+                    "canonical_id": canonical_id,
+                    "header": c.page_content.partition("\n")[0],
+                    "metadata": c.metadata
+                })
+        return unit
+
+    pages = queue.Queue(maxsize=QUEUE_SIZE)
+    parsed = queue.Queue(maxsize=QUEUE_SIZE)
+    chunked = queue.Queue(maxsize=QUEUE_SIZE)
+    embedded = queue.Queue(maxsize=2)
+
+    threads = _run_fetchers(fetcher, pending_urls, pages, fetch_workers)
+    threads += [
+        threading.Thread(target=_run_stage, args=("Parse", parse, pages, parsed), daemon=True),
+        threading.Thread(target=_run_stage, args=("Chunk", chunk, parsed, chunked), daemon=True),
+        threading.Thread(target=_run_embedder, args=(embeddings, chunked, embedded, batch_size), daemon=True)
+    ]
+    for t in threads[fetch_workers:]:
+        t.start()
+
+    # 업로드 단계는 메인 스레드에서 실행하고, 끝난 URL만 파일/체크포인트에 남깁니다.
+    stats = {"urls": 0, "docs": 0, "chunks": 0, "duplicates": 0, "skipped": 0}
+    try:
+        with open(docs_path, "a", encoding="utf-8") as docs_file, \
+             open(chunks_path, "a", encoding="utf-8") as chunks_file, \
+             open(alias_path, "a", encoding="utf-8") as alias_file:
+            while True:
+                item = embedded.get()
+                if item is _DONE:
+                    break
+                units, vectors = item
+                if vectors is None:
+                    for unit in units:
+                        forget(unit)
+                    continue
+                # 대표 청크가 저장되지 못한 별칭이 있으면 그 URL은 건너뜁니다. (별칭이 없는 청크를 가리키지 않도록)
+                accepted, batch_vectors, offset = [], [], 0
+                for unit in units:
+                    unit_vectors = vectors[offset:offset + len(unit.chunks)]
+                    offset += len(unit.chunks)
+                    if any(alias["canonical_id"] in unstored for alias in unit.aliases):
+                        print(f"      [!] Canonical chunk not stored, retry on next run: {unit.url}")
+                        forget(unit)
+                    else:
+                        accepted.append(unit)
+                        batch_vectors.extend(unit_vectors)
+                units = accepted
+                batch_chunks = [c for unit in units for c in unit.chunks]
+                try:
+                    if batch_chunks:
+                        upsert_vectors(vector_store, batch_chunks, batch_vectors, sharded)
+                except Exception as e:
+                    print(f"      [!] Upsert error: {e}")
+                    for unit in units:
+                        forget(unit)
+                    continue
+                if not units:
+                    continue
+                if batch_chunks:
+                    append_vectors([c.id for c in batch_chunks], batch_vectors, vectors_path)
+                for unit in units:
+                    for doc in unit.docs:
+                        docs_file.write(json.dumps({"page_content": doc.page_content, "metadata": doc.metadata}, ensure_ascii=False) + "\n")
+                    for c in unit.chunks:
+                        chunks_file.write(chunk_to_line(c))
+                    for alias in unit.aliases:
+                        alias_file.write(json.dumps(alias, ensure_ascii=False) + "\n")
+                for f in (docs_file, chunks_file, alias_file):
+                    f.flush()
+                skipped = {unit.url: unit.skip_reason for unit in units if unit.skip_reason}
+                for url, reason in skipped.items():
+                    print(f"      [-] Skipped ({reason}): {url}")
+                checkpoint.mark((unit.url for unit in units), skipped)
+                stats["urls"] += len(units)
+                stats["skipped"] += len(skipped)
+                stats["docs"] += sum(len(unit.docs) for unit in units)
+                stats["chunks"] += len(batch_chunks)
+                stats["duplicates"] += sum(len(unit.aliases) for unit in units)
+                print(f"   [+] Upserted {len(batch_chunks)} chunks from {len(units)} URLs "
+                      f"(total {stats['urls']}/{len(pending_urls)} URLs)")
+    finally:
+        fetcher.close()
+
+    merged = apply_aliases(chunks_path, alias_path, vector_store, sharded)
+    print(f"\n2. Ingest complete: {stats['docs']} docs, {stats['chunks']} chunks, "
+          f"{stats['duplicates']} near-duplicates merged into {merged} chunks, {stats['skipped']} URLs skipped")
+    return stats
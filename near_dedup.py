@@ -0,0 +1,170 @@
+import re
+import zlib
+import numpy as np
+
+SHINGLE_SIZE = 5
+NUM_PERM = 128
+BANDS = 32
+THRESHOLD = 0.8
+MERSENNE_PRIME = (1 << 31) - 1
+TITLE_PREFIX_RE = re.compile(r"^\[[^\]]*\]\s*")
+
+
+def dedup_text(text):
+    """비교용 텍스트. 문서마다 다른 [제목] 접두어는 빼고 공백을 정규화합니다."""
+    return " ".join(TITLE_PREFIX_RE.sub("", text, count=1).split())
+
+
+def dedup_group(metadata):
+    """
+    같은 그룹끼리만 중복으로 합칩니다.
+    스킬 레코드는 설명이 같아도 직업(제목)이나 스킬명이 다르면 다른 스킬이므로 (제목, 스킬명)으로 나눕니다.
+    """
+    if metadata.get("skill_name"):
+        return (metadata.get("title", ""), metadata["skill_name"])
+    return None
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """글자 n-gram 집합을 crc32 해시 배열로 돌려줍니다. (한글은 띄어쓰기가 불규칙하므로 글자 단위)"""
+    if len(text) <= size:
+        grams = {text}
+    else:
+        grams = {text[i:i + size] for i in range(len(text) - size + 1)}
+    return np.array([zlib.crc32(g.encode("utf-8")) for g in grams], dtype=np.uint64) % MERSENNE_PRIME
+
+
+class NearDuplicateIndex:
+    """
+    MinHash + LSH 밴딩으로 근사 중복을 찾습니다.
+    후보 비교는 같은 버킷에 들어온 청크끼리만 하므로 전체 쌍을 비교하지 않습니다.
+    add()는 먼저 들어온 청크를 대표(canonical)로 유지합니다.
+    """
+
+    def __init__(self, threshold=THRESHOLD, num_perm=NUM_PERM, bands=BANDS, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._buckets = [dict() for _ in range(bands)]
+        self._signatures = {}
+        self._groups = {}
+
+    def signature(self, text):
+        hashes = shingles(dedup_text(text))
+        # (a * x + b) mod p 를 모든 permutation에 대해 한 번에 계산
+        values = (np.outer(hashes, self._a) + self._b) % MERSENNE_PRIME
+        return values.min(axis=0)
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def query(self, signature, group=None):
+        """같은 group 안에서 threshold 이상으로 추정되는 기존 대표 키 중 가장 비슷한 것을 반환합니다."""
+        candidates = set()
+        for band, key in self._band_keys(signature):
+            candidates.update(self._buckets[band].get(key, ()))
+        best_key, best_score = None, self.threshold
+        for candidate in candidates:
+            if self._groups.get(candidate) != group:
+                continue
+            score = float(np.mean(self._signatures[candidate] == signature))
+            if score >= best_score:
+                best_key, best_score = candidate, score
+        return best_key
+
+    def insert(self, key, signature, group=None):
+        self._signatures[key] = signature
+        self._groups[key] = group
+        for band, band_key in self._band_keys(signature):
+            self._buckets[band].setdefault(band_key, []).append(key)
+
+    def remove(self, key):
+        """등록된 대표 키를 뺍니다. (저장에 실패한 청크가 이후 중복의 대표가 되지 않도록)"""
+        signature = self._signatures.pop(key, None)
+        if signature is None:
+            return
+        self._groups.pop(key, None)
+        for band, band_key in self._band_keys(signature):
+            keys = self._buckets[band].get(band_key, [])
+            if key in keys:
+                keys.remove(key)
+
+    def add(self, key, text, group=None):
+        """중복이면 대표 키를, 새 청크면 None을 반환하고 인덱스에 등록합니다."""
+        signature = self.signature(text)
+        canonical = self.query(signature, group)
+        if canonical is None:
+            self.insert(key, signature, group)
+        return canonical
+
+    def __len__(self):
+        return len(self._signatures)
+
+
+def merge_duplicate(canonical, duplicate):
+    """중복 청크의 출처/제목/헤더 줄을 대표 청크 메타데이터에 합칩니다."""
+    meta = canonical.metadata
+    dup_meta = duplicate.metadata
+    sources = meta.setdefault("sources", [meta.get("source", "")])
+    titles = meta.setdefault("titles", [meta.get("title", "")])
+    if dup_meta.get("source", "") not in sources:
+        sources.append(dup_meta.get("source", ""))
+    if dup_meta.get("title", "") not in titles:
+        titles.append(dup_meta.get("title", ""))
+    # 헤더 줄(예: "[가이드 제목] 섹션")은 본문이 같아도 문서마다 다를 수 있으므로 따로 모아둡니다.
+    header = duplicate.page_content.partition("\n")[0].strip()
+    headers = meta.setdefault("duplicate_headers", [])
+    if header != canonical.page_content.partition("\n")[0].strip() and header not in headers:
+        headers.append(header)
+    duplicate_ids = meta.setdefault("duplicate_ids", [])
+    dup_id = dup_meta.get("chunk_id", duplicate.id)
+    if dup_id not in duplicate_ids:
+        duplicate_ids.append(dup_id)
+    meta["duplicate_count"] = len(duplicate_ids)
+
+
+def apply_duplicate_headers(chunk):
+    """합쳐진 청크의 헤더를 대표 청크 첫 줄에 남겨 다른 문서(예: 다른 직업)로 검색해도 찾을 수 있게 합니다."""
+    headers = chunk.metadata.pop("duplicate_headers", None)
+    if headers:
+        first_line, _, rest = chunk.page_content.partition("\n")
+        chunk.page_content = f"{first_line} (공통: {'; '.join(headers)})\n{rest}"
+
+
+def collapse_near_duplicates(chunks, threshold=THRESHOLD):
+    """
+    근사 중복 청크를 하나의 대표 청크로 합칩니다.
+    반환값: (대표 청크 리스트, 리포트 dict)
+    """
+    index = NearDuplicateIndex(threshold=threshold)
+    canonical_by_id = {}
+    result = []
+    for chunk in chunks:
+        chunk_id = chunk.metadata["chunk_id"]
+        canonical_id = index.add(chunk_id, chunk.page_content, dedup_group(chunk.metadata))
+        if canonical_id is None:
+            canonical_by_id[chunk_id] = chunk
+            result.append(chunk)
+        else:
+            merge_duplicate(canonical_by_id[canonical_id], chunk)
+
+    for chunk in result:
+        apply_duplicate_headers(chunk)
+
+    total = len(chunks)
+    duplicates = total - len(result)
+    report = {
+        "total": total,
+        "unique": len(result),
+        "duplicates": duplicates,
+        "clusters": sum(1 for c in result if c.metadata.get("duplicate_count")),
+        "ratio": duplicates / total if total else 0.0
+    }
+    return result, report
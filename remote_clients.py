@@ -0,0 +1,396 @@
+import os
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+import httpx
+import urllib3
+
+REMOTE_CONFIG = {
+    "max_connections": 64,            # 프로세스 전체 keep-alive 풀 크기 (OpenAI)
+    "max_keepalive_connections": 32,
+    "keepalive_expiry": 30,
+    "timeout": 60,
+    "global_concurrency": 32,         # 모든 원격 호출의 동시 실행 상한
+    "endpoint_concurrency": {         # 엔드포인트별 동시 실행 상한
+        "openai.embeddings": 16,
+        "openai.chat": 8,
+        "pinecone.query": 16,
+        "pinecone.upsert": 4
+    },
+    "default_endpoint_concurrency": 8,
+    "max_retries": 3,
+    "backoff_base": 0.2,              # 재시도 대기: 0 ~ min(backoff_max, base * 2^n) 사이 임의 (full jitter)
+    "backoff_max": 5.0,
+    "retry_budget": 0.2,              # 재시도는 요청 수의 20% (+ 여유 10회) 까지만. 장애 시 재시도 폭주 방지
+    "hedge": ["openai.embeddings", "pinecone.query", "pinecone.fetch"],  # 멱등 호출만
+    "hedge_quantile": 0.95,           # 이 분위 지연 시간이 지나도 응답이 없으면 같은 요청을 한 번 더 보냅니다.
+    "hedge_min_samples": 20,
+    "hedge_default_delay_ms": 500,    # 지연 통계가 쌓이기 전에 쓰는 기준
+    "hedge_min_delay_ms": 50,
+    "pinecone_pool_threads": 4
+}
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+OPENAI_ENDPOINTS = {"/embeddings": "openai.embeddings", "/chat/completions": "openai.chat"}
+
+
+class RetryableResponse(Exception):
+    """재시도 대상 HTTP 상태 코드. 재시도를 모두 쓰면 마지막 응답을 그대로 돌려줍니다."""
+
+    def __init__(self, response):
+        super().__init__(f"HTTP {response.status_code}")
+        self.response = response
+
+
+class EndpointStats:
+    """
+    엔드포인트별 호출 수, 에러/재시도/hedge 횟수, 최근 지연 시간 분포
+    - latencies: 호출자가 기다린 시간 (재시도/hedging 포함)
+    - attempts: 원격 요청 한 번의 시간 (hedge 기준 계산용)
+    """
+
+    def __init__(self, window=1000):
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.latencies = deque(maxlen=window)
+        self.attempts = deque(maxlen=window)
+
+    def record(self, seconds, attempt=False):
+        with self.lock:
+            (self.attempts if attempt else self.latencies).append(seconds)
+
+    def add(self, name, n=1):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def attempt_quantile(self, q):
+        with self.lock:
+            samples = list(self.attempts)
+        return float(np.quantile(samples, q)) if samples else None
+
+    def summary(self):
+        with self.lock:
+            samples = np.array(self.latencies) * 1000
+            summary = {
+                "calls": self.calls,
+                "errors": self.errors,
+                "retries": self.retries,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins
+            }
+        if len(samples):
+            summary.update({
+                "p50_ms": round(float(np.quantile(samples, 0.5)), 1),
+                "p95_ms": round(float(np.quantile(samples, 0.95)), 1),
+                "p99_ms": round(float(np.quantile(samples, 0.99)), 1),
+                "max_ms": round(float(samples.max()), 1)
+            })
+        return summary
+
+
+class RemoteClients:
+    """
+    OpenAI / Pinecone 호출이 함께 쓰는 원격 클라이언트 계층.
+    - keep-alive 연결 풀(httpx, Pinecone urllib3)을 프로세스에서 하나씩만 둡니다.
+    - 전체/엔드포인트별 동시 실행 수를 세마포어로 제한합니다.
+    - 일시적 오류(429/5xx/연결 오류)는 jitter backoff로 재시도하되 retry_budget 안에서만 합니다.
+    - 멱등 호출(임베딩, 벡터 검색)은 지연이 p95를 넘으면 같은 요청을 한 번 더 보내 먼저 온 응답을 씁니다. (hedging)
+    """
+
+    def __init__(self, config=None):
+        self.config = {**REMOTE_CONFIG, **(config or {})}
+        self._lock = threading.Lock()
+        self._global = threading.BoundedSemaphore(self.config["global_concurrency"])
+        self._semaphores = {}
+        self._stats = {}
+        # hedge 요청이 세마포어를 기다리다 막히지 않도록 동시 실행 상한보다 넉넉하게 둡니다.
+        self._executor = ThreadPoolExecutor(max_workers=self.config["global_concurrency"] * 2)
+        self._http_client = None
+        self._pinecone_indexes = {}
+
+    # === 공통 호출 경로 ===
+
+    def _endpoint(self, endpoint):
+        with self._lock:
+            if endpoint not in self._stats:
+                limit = self.config["endpoint_concurrency"].get(endpoint, self.config["default_endpoint_concurrency"])
+                self._semaphores[endpoint] = threading.BoundedSemaphore(limit)
+                self._stats[endpoint] = EndpointStats()
+            return self._semaphores[endpoint], self._stats[endpoint]
+
+    def _limited(self, endpoint, fn, args, kwargs):
+        semaphore, stats = self._endpoint(endpoint)
+        # 엔드포인트 슬롯을 먼저 잡습니다. 포화된 엔드포인트(예: chat)를 기다리는 호출이
+        # 전체 슬롯을 쥐고 있으면 임베딩/벡터 검색까지 막히기 때문입니다.
+        with semaphore, self._global:
+            started = time.monotonic()
+            result = fn(*args, **kwargs)
+            stats.record(time.monotonic() - started, attempt=True)
+            return result
+
+    def hedge_delay(self, endpoint):
+        _, stats = self._endpoint(endpoint)
+        delay = None
+        if len(stats.attempts) >= self.config["hedge_min_samples"]:
+            delay = stats.attempt_quantile(self.config["hedge_quantile"])
+        if delay is None:
+            delay = self.config["hedge_default_delay_ms"] / 1000
+        return max(delay, self.config["hedge_min_delay_ms"] / 1000)
+
+    def _hedged(self, endpoint, fn, args, kwargs):
+        _, stats = self._endpoint(endpoint)
+        primary = self._executor.submit(self._limited, endpoint, fn, args, kwargs)
+        done, _ = wait([primary], timeout=self.hedge_delay(endpoint))
+        if done:
+            return primary.result()
+
+        stats.add("hedges")
+        backup = self._executor.submit(self._limited, endpoint, fn, args, kwargs)
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is backup:
+                        stats.add("hedge_wins")
+                    for loser in pending:
+                        loser.add_done_callback(_close_response)
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def is_retryable(self, error):
+        if isinstance(error, (RetryableResponse, httpx.TransportError, urllib3.exceptions.HTTPError,
+                              ConnectionError, TimeoutError)):
+            return True
+        # Pinecone API 예외는 HTTP 상태 코드를 status로 가지고 있습니다.
+        return getattr(error, "status", None) in RETRY_STATUS
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.config["backoff_max"], self.config["backoff_base"] * 2 ** attempt))
+
+    def call(self, endpoint, fn, *args, hedge=None, **kwargs):
+        """
+        fn(*args, **kwargs)를 동시 실행 제한 / 재시도 / (멱등이면) hedging을 적용해 호출합니다.
+        hedge: None이면 REMOTE_CONFIG["hedge"]에 있는 엔드포인트만 hedging
+        """
+        _, stats = self._endpoint(endpoint)
+        hedge = endpoint in self.config["hedge"] if hedge is None else hedge
+        stats.add("calls")
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                if hedge:
+                    result = self._hedged(endpoint, fn, args, kwargs)
+                else:
+                    result = self._limited(endpoint, fn, args, kwargs)
+                stats.record(time.monotonic() - started)
+                return result
+            except Exception as e:
+                stats.add("errors")
+                budget = self.config["retry_budget"] * stats.calls + 10
+                if attempt >= self.config["max_retries"] or not self.is_retryable(e) or stats.retries >= budget:
+                    raise
+                attempt += 1
+                stats.add("retries")
+                time.sleep(self.backoff(attempt))
+
+    def stats(self):
+        with self._lock:
+            endpoints = dict(self._stats)
+        return {endpoint: stats.summary() for endpoint, stats in sorted(endpoints.items())}
+
+    # === 클라이언트 ===
+
+    def http_client(self):
+        """OpenAI SDK가 함께 쓰는 keep-alive httpx 클라이언트"""
+        with self._lock:
+            if self._http_client is None:
+                limits = httpx.Limits(
+                    max_connections=self.config["max_connections"],
+                    max_keepalive_connections=self.config["max_keepalive_connections"],
+                    keepalive_expiry=self.config["keepalive_expiry"]
+                )
+                self._http_client = httpx.Client(
+                    transport=PooledTransport(self, httpx.HTTPTransport(limits=limits)),
+                    timeout=self.config["timeout"]
+                )
+            return self._http_client
+
+    def embeddings(self, model, dimensions=None, **kwargs):
+        from langchain_openai import OpenAIEmbeddings
+        # 재시도는 이 계층에서만 합니다. (SDK 재시도와 겹치면 재시도 예산을 넘게 됩니다)
+        return OpenAIEmbeddings(model=model, dimensions=dimensions, http_client=self.http_client(),
+                                max_retries=0, **kwargs)
+
+    def chat_model(self, model, **kwargs):
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(model=model, http_client=self.http_client(), max_retries=0, **kwargs)
+
+    def pinecone_index(self, index_name):
+        """인덱스 이름당 하나의 Pinecone Index(연결 풀)를 공유합니다."""
+        with self._lock:
+            if index_name not in self._pinecone_indexes:
+                from pinecone import Pinecone
+                client = Pinecone(api_key=os.getenv("PINECONE_API_KEY"), pool_threads=self.config["pinecone_pool_threads"])
+                index = client.Index(index_name, connection_pool_maxsize=self.config["max_connections"])
+                self._pinecone_indexes[index_name] = PooledIndex(index, self)
+            return self._pinecone_indexes[index_name]
+
+    def vector_store(self, index_name, embeddings, namespace=None):
+        from langchain_pinecone import PineconeVectorStore
+        return PineconeVectorStore(index=self.pinecone_index(index_name), embedding=embeddings, namespace=namespace)
+
+    def close(self):
+        if self._http_client is not None:
+            self._http_client.close()
+        self._executor.shutdown(wait=False)
+
+
+def _close_response(future):
+    """hedging에서 늦게 도착한 쪽 응답의 연결을 풀로 돌려줍니다."""
+    if future.exception() is None and isinstance(future.result(), httpx.Response):
+        future.result().close()
+
+
+class PooledTransport(httpx.BaseTransport):
+    """OpenAI SDK의 HTTP 요청을 RemoteClients.call 경로로 보냅니다."""
+
+    def __init__(self, clients, transport):
+        self.clients = clients
+        self.transport = transport
+
+    def handle_request(self, request):
+        path = request.url.path
+        endpoint = next((name for suffix, name in OPENAI_ENDPOINTS.items() if path.endswith(suffix)),
+                        f"http.{request.url.host}")
+
+        def send():
+            response = self.transport.handle_request(request)
+            if response.status_code in RETRY_STATUS:
+                response.read()
+                response.close()
+                raise RetryableResponse(response)
+            return response
+
+        try:
+            return self.clients.call(endpoint, send)
+        except RetryableResponse as e:
+            return e.response
+
+    def close(self):
+        self.transport.close()
+
+
+class PooledIndex:
+    """Pinecone Index 프록시. 데이터 호출만 RemoteClients.call로 감싸고 나머지는 그대로 넘깁니다."""
+
+    def __init__(self, index, clients):
+        self._index = index
+        self._clients = clients
+
+    def query(self, *args, **kwargs):
+        return self._clients.call("pinecone.query", self._index.query, *args, **kwargs)
+
+    def fetch(self, *args, **kwargs):
+        return self._clients.call("pinecone.fetch", self._index.fetch, *args, **kwargs)
+
+    def upsert(self, *args, **kwargs):
+        # 같은 ID로 다시 올리면 덮어쓰므로 재시도해도 안전합니다.
+        return self._clients.call("pinecone.upsert", self._index.upsert, *args, **kwargs)
+
+    def update(self, *args, **kwargs):
+        return self._clients.call("pinecone.update", self._index.update, *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._clients.call("pinecone.delete", self._index.delete, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._index, name)
+
+
+_clients = None
+_clients_lock = threading.Lock()
+
+def get_remote_clients():
+    """프로세스 전체에서 공유하는 RemoteClients"""
+    global _clients
+    with _clients_lock:
+        if _clients is None:
+            _clients = RemoteClients()
+        return _clients
+
+
+# === 로컬 stub 서버 (지연/오류 주입) ===
+
+def start_stub_server(slow_ratio=0.05, slow_seconds=1.0, base_seconds=0.02, error_ratio=0.0, dimensions=8):
+    """
+    OpenAI /embeddings 형식으로 응답하는 로컬 서버를 스레드로 띄웁니다.
+    slow_ratio 비율의 요청은 slow_seconds 만큼, error_ratio 비율은 503으로 응답합니다.
+    반환값: (server, base_url)
+    """
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if random.random() < error_ratio:
+                self._reply(503, {"error": {"message": "stub overloaded"}})
+                return
+            time.sleep(slow_seconds if random.random() < slow_ratio else base_seconds)
+            inputs = body.get("input", [])
+            inputs = inputs if isinstance(inputs, list) else [inputs]
+            data = [{"object": "embedding", "index": i, "embedding": [0.1] * dimensions} for i in range(len(inputs))]
+            self._reply(200, {"object": "list", "data": data, "model": body.get("model", "stub"),
+                              "usage": {"prompt_tokens": 0, "total_tokens": 0}})
+
+        def _reply(self, status, payload):
+            raw = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.handle_error = lambda request, client_address: None  # 종료 시 끊긴 keep-alive 연결 로그 생략
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    import argparse
+
+    # python remote_clients.py --requests 200 --slow-ratio 0.05 --error-ratio 0.02
+    parser = argparse.ArgumentParser(description="로컬 stub 서버로 hedging/재시도 효과 측정")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--slow-ratio", type=float, default=0.05)
+    parser.add_argument("--slow-seconds", type=float, default=1.0)
+    parser.add_argument("--error-ratio", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(args.slow_ratio, args.slow_seconds, error_ratio=args.error_ratio)
+    for hedge in (False, True):
+        clients = RemoteClients({"hedge": ["openai.embeddings"] if hedge else []})
+        embeddings = clients.embeddings("stub-embedding", api_key="stub", base_url=base_url, check_embedding_ctx_length=False)
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            list(executor.map(lambda i: embeddings.embed_query(f"query {i}"), range(args.requests)))
+        print(f"[hedge={'on' if hedge else 'off'}] {clients.stats()}")
+        clients.close()
+    server.shutdown()